@@ -0,0 +1,116 @@
+import asyncio
+import time
+from google.api_core import exceptions
+
+# --- NOPEUSRAJOITIN ---
+class TokenBucket:
+    def __init__(self, requests_per_minute, capacity=None):
+        self.rate = requests_per_minute / 60.0
+        # Oletuksena sallitaan noin 10 sekunnin kiintiö kerralla
+        self.capacity = capacity or max(1, int(requests_per_minute / 6))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# --- ASYNC-ASIAKAS ---
+class AsyncGeminiClient:
+    def __init__(self, model, requests_per_minute=15, max_concurrency=4, retries=3, initial_backoff=10, stats=None):
+        self.model = model
+        # Valinnainen run_stats.RunStats: kutsut, uusintayritykset ja odotusajat
+        self.stats = stats
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.initial_backoff = initial_backoff
+        self._bucket = None
+        self._semaphore = None
+
+    def _ensure_limits(self):
+        # Luodaan vasta tapahtumasilmukan sisällä (asyncio.run luo uuden silmukan)
+        if self._bucket is None:
+            self._bucket = TokenBucket(self.requests_per_minute)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _call(self, prompt):
+        if hasattr(self.model, "generate_content_async"):
+            return await self.model.generate_content_async(prompt)
+        return await asyncio.to_thread(self.model.generate_content, prompt)
+
+    async def generate(self, prompt):
+        response = await self.generate_response(prompt)
+        return response.text if response is not None else None
+
+    async def generate_response(self, prompt):
+        self._ensure_limits()
+        wait_time = self.initial_backoff
+        for attempt in range(self.retries):
+            start = time.perf_counter()
+            await self._bucket.acquire()
+            if self.stats:
+                self.stats.add_time("gemini_rate_limit_wait", time.perf_counter() - start)
+                self.stats.incr("gemini_calls")
+            try:
+                async with self._semaphore:
+                    return await self._call(prompt)
+            except exceptions.ResourceExhausted:
+                print(f"    ⚠️ Kiintiö täynnä (Yritys {attempt+1}/{self.retries}). Odotetaan {wait_time}s...")
+                start = time.perf_counter()
+                await asyncio.sleep(wait_time)
+                if self.stats:
+                    self.stats.incr("gemini_retries")
+                    self.stats.add_time("gemini_backoff_sleep", time.perf_counter() - start)
+                wait_time *= 2
+            except Exception as e:
+                print(f"    ⚠️ AI Virhe: {e}")
+                if self.stats:
+                    self.stats.incr("gemini_errors")
+                return None
+        return None
+
+    async def generate_many(self, prompts):
+        return await asyncio.gather(*(self.generate(p) for p in prompts))
+
+# --- PAIKALLINEN TESTIMALLI ---
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    # Palauttaa valmiit vastaukset ilman verkkoa. quota_errors kertoo, moneenko
+    # ensimmäiseen kutsuun vastataan ResourceExhausted-virheellä.
+    def __init__(self, responder=None, responses=None, quota_errors=0, latency=0.0):
+        self.responder = responder
+        self.responses = list(responses or [])
+        self.quota_errors = quota_errors
+        self.latency = latency
+        self.prompts = []
+
+    def _respond(self, prompt):
+        self.prompts.append(prompt)
+        if self.quota_errors > 0:
+            self.quota_errors -= 1
+            raise exceptions.ResourceExhausted("Fake quota exceeded")
+        if self.responder:
+            return FakeResponse(self.responder(prompt))
+        if self.responses:
+            return FakeResponse(self.responses.pop(0))
+        return FakeResponse("Muu")
+
+    def generate_content(self, prompt):
+        if self.latency: time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt):
+        if self.latency: await asyncio.sleep(self.latency)
+        return self._respond(prompt)
@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import data_enricher as de
+from ai_client import FakeModel
+from finnish_places import inflection_stems
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+# --- SYNTEETTINEN AINEISTO ---
+EVENTS = [
+    "Lento-onnettomuus", "Vaaratilanne", "Vakava vaaratilanne", "Helikopterionnettomuus",
+    "Purjelentokoneen onnettomuus", "Laskuvarjohyppyonnettomuus", "Lentokoneen pakkolasku",
+    "Ultrakevyen lentokoneen onnettomuus", "Kuumailmapallon kova lasku", "Liikennelentokoneen vaaratilanne",
+    "Lentokoneen maahansyöksy", "Harrasterakenteisen lentokoneen onnettomuus",
+]
+FILLER = [
+    "Tutkinnassa selvitettiin tapahtumien kulku ja niihin vaikuttaneet tekijät.",
+    "Ohjaaja oli lennon ainoa henkilö koneessa.",
+    "Sää oli tapahtumahetkellä hyvä ja näkyvyys yli 10 kilometriä.",
+    "Lennonjohto antoi laskeutumisluvan kiitotielle.",
+    "Koneen moottori pysähtyi loppulähestymisen aikana.",
+    "Tutkintalautakunta antoi kaksi turvallisuussuositusta.",
+    "Henkilövahinkoja ei aiheutunut, mutta kone vaurioitui pahoin.",
+    "Liikenteen turvallisuusvirasto oli myöntänyt lentoluvan.",
+]
+# Suodatettavia raportteja ja .pdf/.txt-duplikaatteja kuten oikeassa arkistossa
+NOISE_IDS = ["Tutkintaselostukset 2010", "OTKES vuosikatsaus", "Raideliikenne R2011-01", "Vesiliikenne onnettomuus"]
+
+def aircraft_mentions():
+    # Rules-taulukon tavalliset avainsanat sellaisenaan (ei regex-erikoismerkkejä)
+    mentions = []
+    for _, keywords, _ in de.AIRCRAFT_RULES:
+        mentions.extend(k for k in keywords if not any(c in k for c in "\\[]().*+?"))
+    return mentions
+
+def harmonize(ending, word):
+    # Vokaalisointu: takavokaalisissa sanoissa a/o/u, muuten ä/ö/y
+    if any(c in word for c in "aou"):
+        return ending
+    return ending.replace("a", "ä")
+
+def inflect(name, rng):
+    # Paikallissija johdetusta vartalosta, esim. Rovaniemi -> Rovaniemellä
+    stems = sorted(inflection_stems(name) - {name.lower()}) or [name.lower()]
+    stem = rng.choice(stems)
+    word = stem + harmonize(rng.choice(["lla", "ssa", "lta", "n"]), stem)
+    return "-".join(part.capitalize() for part in word.split("-"))
+
+def report_id(rng, year):
+    if year <= 2010:
+        return f"{rng.choice('ABCD')}{rng.randint(1, 30)}{year}L"
+    if rng.random() < 0.1:
+        return f"L{year}-E{rng.randint(1, 9)}"
+    return f"L{year}-{rng.randint(1, 20):02d}"
+
+def generate_corpus(size, seed=1):
+    rng = random.Random(seed)
+    places = list(de.LOCATIONS) + sorted(set(de.SYNONYMS.values()) - set(de.LOCATIONS))
+    mentions = aircraft_mentions()
+    corpus = []
+    while len(corpus) < size:
+        year = rng.randint(1996, 2024)
+        place = rng.choice(places)
+        date = f"{rng.randint(1, 28)}.{rng.randint(1, 12)}.{year}"
+        title = f"{report_id(rng, year)} {rng.choice(EVENTS)} {inflect(place, rng)} {date}"
+        sentences = rng.sample(FILLER, k=rng.randint(3, len(FILLER)))
+        # Noin joka kuudennessa raportissa ei mainita konetyyppiä (AI-polku)
+        if rng.random() > 0.15:
+            sentences.insert(rng.randint(0, len(sentences)), f"Kone oli {rng.choice(mentions)}, rekisteritunnus OH-{''.join(rng.choices('ABCDEFGHIJKLMNOPRSTUVXYZ', k=3))}.")
+        other = rng.choice(places)
+        sentences.insert(rng.randint(0, len(sentences)), f"Kone lähti {inflect(other, rng)} ja oli matkalla {inflect(place, rng)}.")
+        text = " ".join(sentences * rng.randint(1, 4))
+        if rng.random() < 0.05:
+            corpus.append({"id": rng.choice(NOISE_IDS), "text": text})
+            continue
+        corpus.append({"id": title + ".pdf", "text": text})
+        if rng.random() < 0.05 and len(corpus) < size:
+            corpus.append({"id": title + ".txt", "text": text})
+    return corpus
+
+# --- VERKKOTYNGÄT ---
+class FakeLocation:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+class FakeGeocoder:
+    # Deterministinen geokoodaus nimen tiivisteestä; osa nimistä "ei löydy"
+    def geocode(self, query, timeout=None):
+        digest = hashlib.sha256(query.encode('utf-8')).digest()
+        if digest[0] < 26:
+            return None
+        return FakeLocation(60 + digest[1] / 255 * 10, 20 + digest[2] / 255 * 11)
+
+@contextlib.contextmanager
+def stubbed_network():
+    saved = de.model, de.geolocator, de.time.sleep
+    de.model = FakeModel()
+    de.geolocator = FakeGeocoder()
+    de.time.sleep = lambda seconds: None
+    try:
+        yield
+    finally:
+        de.model, de.geolocator, de.time.sleep = saved
+
+# --- VAIHEET ---
+def stage_detect_aircraft(corpus):
+    cache = {}
+    for entry in corpus:
+        de.detect_aircraft_smart(entry["id"], entry["text"], cache, entry["id"], ai_model=de.model)
+
+def stage_find_location(corpus):
+    for entry in corpus:
+        de.find_location_in_text(entry["text"])
+
+def stage_extract_title(corpus):
+    for entry in corpus:
+        de.extract_location_from_title(entry["id"])
+
+def stage_get_coordinates(corpus):
+    cache = {}
+    gazetteer = de.Gazetteer.load(de.GAZETTEER_FILE, normalize=de.clean_finnish_location)
+    gazetteer.add_source(de.LOCATIONS, "lentopaikka")
+    for entry in corpus:
+        de.get_coordinates(de.extract_location_from_title(entry["id"]), cache, gazetteer, geocoder=de.geolocator)
+
+def stage_main(corpus):
+    # Koko putki väliaikaisessa hakemistossa: sama syöte, tyhjät välimuistit
+    work = tempfile.mkdtemp(prefix="enrich_bench_")
+    cwd, argv = os.getcwd(), sys.argv
+    try:
+        if os.path.exists(de.GAZETTEER_FILE):
+            shutil.copy(de.GAZETTEER_FILE, work)
+        os.chdir(work)
+        with open(de.INPUT_FILE, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f, ensure_ascii=False)
+        sys.argv = ["data_enricher.py", "--ai-rpm", "1000000"]
+        de.main()
+    finally:
+        sys.argv = argv
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+STAGES = {
+    "detect_aircraft_smart": stage_detect_aircraft,
+    "find_location_in_text": stage_find_location,
+    "extract_location_from_title": stage_extract_title,
+    "get_coordinates": stage_get_coordinates,
+    "main": stage_main,
+}
+
+def time_stage(func, corpus, repeat):
+    # Paras (pienin) aika toistoista: vähiten taustakuorman häiritsemä
+    best = None
+    for _ in range(repeat):
+        # Vaiheiden tulosteet ohjataan pois, ettei päätteen nopeus vaikuta mittaukseen
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(corpus)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "seconds": round(best, 6),
+        "us_per_item": round(best / len(corpus) * 1e6, 2),
+        "items_per_second": round(len(corpus) / best, 1) if best else None,
+    }
+
+def run(size, repeat, seed, stages):
+    corpus = generate_corpus(size, seed)
+    results = {}
+    with stubbed_network():
+        for name in stages:
+            results[name] = time_stage(STAGES[name], corpus, repeat)
+            print(f"  {name:<28} {results[name]['seconds']:>9.4f} s  {results[name]['us_per_item']:>10.1f} µs/raportti")
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "size": size,
+        "seed": seed,
+        "repeat": repeat,
+        "stages": results,
+    }
+
+def compare(results, baseline, tolerance):
+    # Verrataan raporttikohtaisia aikoja, jotta eri kokoiset ajot ovat vertailukelpoisia
+    regressions = []
+    for name, current in results["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            continue
+        ratio = current["us_per_item"] / old["us_per_item"] if old["us_per_item"] else 1.0
+        status = "HIDASTUNUT" if ratio > 1 + tolerance else "ok"
+        print(f"  {name:<28} {ratio:>6.2f}x perustasoon nähden  {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Rikastusputken suorituskykymittaus synteettisellä aineistolla")
+    parser.add_argument("--size", type=int, default=500, help="Synteettisten raporttien määrä")
+    parser.add_argument("--repeat", type=int, default=5, help="Toistot vaihetta kohden (paras aika jää voimaan)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", default=RESULTS_FILE, help="Tulokset JSON-muodossa")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Perustaso, johon tuloksia verrataan")
+    parser.add_argument("--save-baseline", action="store_true", help="Tallenna tämä ajo uudeksi perustasoksi")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Sallittu hidastuminen (0.25 = 25 %%)")
+    parser.add_argument("--write-corpus", help="Kirjoita synteettinen aineisto tiedostoon ja lopeta")
+    args = parser.parse_args()
+
+    if args.write_corpus:
+        with open(args.write_corpus, 'w', encoding='utf-8') as f:
+            json.dump(generate_corpus(args.size, args.seed), f, ensure_ascii=False, indent=4)
+        print(f"Kirjoitettu {args.size} raporttia: {args.write_corpus}")
+        return
+
+    print(f"Mitataan {args.size} synteettisellä raportilla ({args.repeat} toistoa)...")
+    results = run(args.size, args.repeat, args.seed, args.stages)
+    de.save_json(results, args.output)
+    print(f"Tulokset: {args.output}")
+
+    if args.save_baseline:
+        de.save_json(results, args.baseline)
+        print(f"Perustaso tallennettu: {args.baseline}")
+        return
+    baseline = de.load_json(args.baseline)
+    if not baseline:
+        print("Perustasoa ei ole, vertailu ohitetaan (--save-baseline luo sen).")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Hidastuneet vaiheet: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import time
+
+CACHE_DB_FILE = "enrich_cache.sqlite3"
+
+# --- SQLITE-VÄLIMUISTI ---
+class CacheDB:
+    def __init__(self, filename=CACHE_DB_FILE):
+        self.conn = sqlite3.connect(filename, timeout=30)
+        # WAL: lukijat eivät estä kirjoittajaa, ja rinnakkaiset ajot voivat kirjoittaa samaan tiedostoon
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self.conn.commit()
+        self.stores = []
+
+    def namespace(self, name, ttl=None, negative_ttl=None, batch_size=20):
+        store = CacheStore(self, name, ttl=ttl, negative_ttl=negative_ttl, batch_size=batch_size)
+        self.stores.append(store)
+        return store
+
+    def close(self):
+        for store in self.stores:
+            store.flush()
+        self.conn.close()
+
+class CacheStore:
+    # Sanakirjan kaltainen näkymä yhteen nimiavaruuteen. Arvot tallennetaan JSONina,
+    # None tarkoittaa negatiivista tulosta (esim. paikkaa ei löytynyt).
+    def __init__(self, db, name, ttl=None, negative_ttl=None, batch_size=20):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.batch_size = batch_size
+        self._pending = {}
+
+    def _lookup(self, key):
+        if key in self._pending:
+            return True, self._pending[key][0]
+        row = self.db.conn.execute(
+            "SELECT value, updated FROM cache WHERE namespace = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        if row is None:
+            return False, None
+        value = json.loads(row[0]) if row[0] is not None else None
+        age = time.time() - row[1]
+        limit = self.negative_ttl if value is None else self.ttl
+        if limit is not None and age > limit:
+            return False, None
+        return True, value
+
+    def __contains__(self, key):
+        return self._lookup(key)[0]
+
+    def __getitem__(self, key):
+        found, value = self._lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        found, value = self._lookup(key)
+        return value if found else default
+
+    def __setitem__(self, key, value):
+        self._pending[key] = (value, time.time())
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def __len__(self):
+        self.flush()
+        return self.db.conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.name,)).fetchone()[0]
+
+    def flush(self):
+        if not self._pending:
+            return
+        rows = [
+            (self.name, key, json.dumps(value, ensure_ascii=False) if value is not None else None, updated)
+            for key, (value, updated) in self._pending.items()
+        ]
+        with self.db.conn:
+            self.db.conn.executemany("""
+                INSERT INTO cache (namespace, key, value, updated) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated = excluded.updated
+            """, rows)
+        self._pending.clear()
+
+    def import_json(self, filename):
+        # Vanhan JSON-välimuistin tuonti kerran: vain jos nimiavaruus on vielä tyhjä
+        if len(self) or not os.path.exists(filename):
+            return 0
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return 0
+        now = time.time()
+        with self.db.conn:
+            self.db.conn.executemany(
+                "INSERT OR IGNORE INTO cache (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                [(self.name, key, json.dumps(value, ensure_ascii=False) if value is not None else None, now)
+                 for key, value in data.items()]
+            )
+        return len(data)
@@ -0,0 +1,18 @@
+import io
+
+BAR_COLOR = '#0f5499'
+
+# --- KAAVIOT (valmiit PNG-tavut) ---
+# matplotlib tuodaan vasta piirrettäessä, ja kuva tehdään suoraan Figure-oliona
+# ilman pyplotia: pyplot pitää kaikki avoimet kuvat muistissa, kunnes ne suljetaan.
+def location_chart_png(loc_counts, title="Yleisimmät paikkakunnat (valittu ryhmä)", dpi=100):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 4))
+    ax = fig.subplots()
+    ax.barh([str(name) for name in loc_counts.index], loc_counts.to_numpy(), color=BAR_COLOR, edgecolor='black')
+    ax.set_title(title)
+    ax.invert_yaxis()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    return buf.getvalue()
@@ -0,0 +1,108 @@
+import os
+
+# pyarrow on valinnainen: ilman sitä kirjoitetaan ja luetaan pelkkää JSONia
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+COLUMNAR_FILE = "structured_data.arrow"
+
+# Toistuvat tekstiarvot tallennetaan sanakirjakoodattuina
+DICTIONARY_COLUMNS = ["date", "aircraft_type", "country", "location_name", "report_class", "event_class"]
+FLOAT_COLUMNS = ["lat", "lon"]
+# Tyhjät listat eivät kerro tyyppiä, joten se kiinnitetään
+STRING_LIST_COLUMNS = ["registrations"]
+
+def available():
+    return pa is not None
+
+class ColumnarWriter:
+    # Kirjoittaa IPC-tiedoston erä kerrallaan. Sanakirjakoodattujen sarakkeiden
+    # sanakirja vain kasvaa, jolloin jokainen erä lisää siihen deltan.
+    def __init__(self, filename=COLUMNAR_FILE):
+        self.filename = filename
+        self.tmp_file = filename + ".tmp"
+        self.schema = None
+        self.writer = None
+        self.sink = None
+        self.dictionaries = {}
+        self.count = 0
+
+    def _array(self, name, values):
+        if name in FLOAT_COLUMNS:
+            return pa.array(values, type=pa.float64())
+        if name in STRING_LIST_COLUMNS:
+            return pa.array(values, type=pa.list_(pa.string()))
+        if name in DICTIONARY_COLUMNS:
+            positions, dictionary = self.dictionaries.setdefault(name, ({}, []))
+            indices = []
+            for value in values:
+                if value is None:
+                    indices.append(None)
+                    continue
+                if value not in positions:
+                    positions[value] = len(dictionary)
+                    dictionary.append(value)
+                indices.append(positions[value])
+            return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), pa.array(dictionary, type=pa.string()))
+        if self.schema is not None:
+            return pa.array(values, type=self.schema.field(name).type)
+        array = pa.array(values)
+        return array.cast(pa.string()) if pa.types.is_null(array.type) else array
+
+    def write(self, records):
+        if pa is None or not records:
+            return
+        if self.writer is None:
+            names = list(records[0].keys())
+            arrays = [self._array(name, [r.get(name) for r in records]) for name in names]
+            self.schema = pa.schema([(name, array.type) for name, array in zip(names, arrays)])
+            # Pakkaamaton IPC-tiedosto, jotta lukija voi muistikartoittaa sen suoraan
+            self.sink = pa.OSFile(self.tmp_file, 'wb')
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_file(self.sink, self.schema, options=options)
+        else:
+            arrays = [self._array(name, [r.get(name) for r in records]) for name in self.schema.names]
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        self.count += len(records)
+
+    def close(self):
+        if pa is None:
+            print("VAROITUS: pyarrow puuttuu, sarakemuotoista tiedostoa ei kirjoiteta.")
+            return False
+        if self.writer is None:
+            # Tyhjä ajo: pelkkä id-sarake, jotta lukija saa kelvollisen taulun
+            self.schema = pa.schema([("id", pa.string())])
+            self.sink = pa.OSFile(self.tmp_file, 'wb')
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.tmp_file, self.filename)
+        return True
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+            os.remove(self.tmp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_columnar(records, filename=COLUMNAR_FILE):
+    writer = ColumnarWriter(filename)
+    writer.write(records)
+    return writer.close()
+
+def open_columnar(filename=COLUMNAR_FILE):
+    # Muistikartoitettu taulu: sarakkeet luetaan levyltä vasta, kun niitä käytetään
+    source = pa.memory_map(filename, 'r')
+    return pa.ipc.open_file(source).read_all()
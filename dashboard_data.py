@@ -0,0 +1,176 @@
+import json
+import os
+import pandas as pd
+import columnar_store
+from report_fields import event_class_from_title
+from search_index import SearchIndex, SEARCH_INDEX_FILE
+from spatial_index import SpatialIndex, SPATIAL_INDEX_FILE
+
+DATA_FILE = "structured_data.json"
+COLUMNAR_FILE = columnar_store.COLUMNAR_FILE
+ANALYSES_FILE = "ai_analyses.json"
+
+# Listaus, kartta ja tilastot tarvitsevat vain nämä; tiivistelmä ja linkki haetaan erikseen
+LIST_COLUMNS = ["id", "date", "aircraft_type", "location_name", "lat", "lon", "event_class"]
+DETAIL_COLUMNS = ["summary", "url", "event_date", "registrations"]
+
+def source_file():
+    # Sarakemuotoinen tiedosto, jos se on olemassa eikä vanhempi kuin JSON
+    if columnar_store.available() and os.path.exists(COLUMNAR_FILE):
+        if not os.path.exists(DATA_FILE) or os.stat(COLUMNAR_FILE).st_mtime_ns >= os.stat(DATA_FILE).st_mtime_ns:
+            return COLUMNAR_FILE
+    return DATA_FILE
+
+def data_version(filename=None):
+    # Versio vaihtuu aina, kun rikastin kirjoittaa tiedoston uudelleen
+    filename = filename or source_file()
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return "missing"
+    return f"{filename}-{stat.st_mtime_ns}-{stat.st_size}"
+
+def load_frame(columns=None, filename=None):
+    filename = filename or source_file()
+    if filename == COLUMNAR_FILE:
+        table = columnar_store.open_columnar(filename)
+        if columns:
+            table = table.select([c for c in columns if c in table.column_names])
+        df = table.to_pandas()
+    else:
+        with open(filename, 'r', encoding='utf-8') as f:
+            df = pd.DataFrame(json.load(f))
+        if columns and not df.empty:
+            df = df[[c for c in columns if c in df.columns]]
+    # Rivin paikka lähdetiedostossa, jotta yksityiskohdat voidaan hakea myöhemmin
+    df['row'] = range(len(df))
+    return df
+
+def load_details(rows, filename=None):
+    filename = filename or source_file()
+    if filename == COLUMNAR_FILE:
+        table = columnar_store.open_columnar(filename)
+        # Vanhemmista tiedostoista voi puuttua uusia kenttiä
+        columns = [c for c in DETAIL_COLUMNS if c in table.column_names]
+        return table.select(columns).take(rows).to_pylist()
+    with open(filename, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    return [{k: records[i].get(k) for k in DETAIL_COLUMNS} for i in rows]
+
+def load_analyses(filename=ANALYSES_FILE):
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            analyses = json.load(f)
+        # Uudet merkinnät tallennetaan välimuistiavaimen kanssa: {"text": ..., "cache_key": ...}
+        return {k: (v.get("text", "") if isinstance(v, dict) else v) for k, v in analyses.items()}
+    except:
+        return {}
+
+def load_search_index(filename=SEARCH_INDEX_FILE):
+    # Rikastimen rakentama käänteisindeksi; ilman sitä haku ei ole käytössä
+    if not os.path.exists(filename):
+        return None
+    return SearchIndex.load(filename)
+
+def load_spatial_index(filename=SPATIAL_INDEX_FILE):
+    # Rikastimen rakentama ruudukkoindeksi; ilman sitä säderajaus ja lämpökartta eivät ole käytössä
+    if not os.path.exists(filename):
+        return None
+    return SpatialIndex.load(filename)
+
+# --- ESILASKETTU DATAKERROS ---
+class DashboardData:
+    def __init__(self, df):
+        if not df.empty:
+            df = df.copy()
+            # Tyypitetyt sarakkeet: vuosi numerona (N/A -> 0), toistuvat tekstit kategorioina
+            df['date'] = df['date'].astype(str)
+            df['year'] = pd.to_numeric(df['date'], errors='coerce').fillna(0).astype('int16')
+            df['aircraft_type'] = df['aircraft_type'].astype('category')
+            df['location_name'] = df['location_name'].astype('category')
+            # Rikastimen poimima luokka; vanhalle datalle johdetaan otsikosta kerran latauksessa
+            if 'event_class' not in df.columns:
+                df['event_class'] = df['id'].map(event_class_from_title)
+            df['event_class'] = df['event_class'].fillna("muu").astype('category')
+            df['is_accident'] = (df['event_class'] == "onnettomuus").to_numpy()
+            # Järjestys kerran: vuosi ja ID laskevasti (uusin ensin)
+            df = df.sort_values(by=['year', 'id'], ascending=[False, False]).reset_index(drop=True)
+        self.df = df
+
+        # Ryhmäkohtaiset rivi-indeksit järjestetyssä kehyksessä
+        self.group_indices = {}
+        if not df.empty:
+            self.group_indices = {
+                ac: positions for ac, positions in df.groupby('aircraft_type', observed=True).indices.items()
+            }
+
+        if df.empty:
+            self.aircraft_types = ["Ei dataa"]
+        else:
+            # Järjestetään aakkosiin
+            self.aircraft_types = ["Kaikki"] + sorted(x for x in self.group_indices if x != "Kaikki")
+
+        self.aggregates = {}
+        if not df.empty:
+            self.aggregates["Kaikki"] = self._aggregate(df)
+            for ac in self.group_indices:
+                self.aggregates[ac] = self._aggregate(self.view(ac))
+
+    @staticmethod
+    def _aggregate(view):
+        loc_counts = view['location_name'].value_counts()
+        return {
+            "locations": loc_counts[loc_counts > 0].head(10),
+            "years": view['date'].value_counts().sort_index(),
+        }
+
+    def view(self, ac_type):
+        if ac_type == "Kaikki":
+            return self.df
+        positions = self.group_indices.get(ac_type)
+        if positions is None:
+            return self.df.iloc[0:0]
+        return self.df.take(positions)
+
+    def count(self, ac_type):
+        if ac_type == "Kaikki":
+            return len(self.df)
+        positions = self.group_indices.get(ac_type)
+        return 0 if positions is None else len(positions)
+
+    def page(self, ac_type, start, size):
+        # Viipaloidaan vain näkyvä sivu valmiiksi järjestetystä kehyksestä
+        if ac_type == "Kaikki":
+            return self.df.iloc[start:start + size]
+        positions = self.group_indices.get(ac_type)
+        if positions is None:
+            return self.df.iloc[0:0]
+        return self.df.take(positions[start:start + size])
+
+    def in_rows(self, ac_type, rows):
+        # Rajataan näkymä lähdetiedoston rivinumeroihin (esim. sijainti-indeksin säde); järjestys säilyy
+        view = self.view(ac_type)
+        return view[view['row'].isin(rows)]
+
+    def search_results(self, ac_type, hits):
+        # hits: [(id, pisteet)] parhaasta alkaen. Rajataan valittuun tyyppiin ja
+        # järjestetään osuvuuden mukaan; tekstejä ei käydä läpi.
+        view = self.view(ac_type)
+        if not hits or view.empty:
+            return view.iloc[0:0]
+        scores = dict(hits)
+        matched = view[view['id'].isin(scores.keys())]
+        order = matched['id'].map(scores).sort_values(ascending=False, kind='stable').index
+        return matched.loc[order]
+
+    def view_counts(self, view):
+        # Samat koosteet rajatulle näkymälle (esim. säderajaus); lasketaan kysyttäessä
+        return self._aggregate(view)
+
+    def location_counts(self, ac_type):
+        agg = self.aggregates.get(ac_type)
+        return agg["locations"] if agg else pd.Series(dtype='int64')
+
+    def year_counts(self, ac_type):
+        agg = self.aggregates.get(ac_type)
+        return agg["years"] if agg else pd.Series(dtype='int64')
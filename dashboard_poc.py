@@ -1,33 +1,93 @@
 import streamlit as st
 import pandas as pd
-import json
-import folium
-from streamlit_folium import st_folium
-import matplotlib.pyplot as plt
+import math
+import time
+import dashboard_data
+from dashboard_data import DashboardData, data_version, load_frame, load_details, load_search_index, load_spatial_index, LIST_COLUMNS, SEARCH_INDEX_FILE, SPATIAL_INDEX_FILE
+import map_layer
+import charts
 
 # Asetukset
 st.set_page_config(page_title="Turvallisuustutkinta-yhteenveto (PoC)", layout="wide", page_icon="✈️")
 
+PAGE_SIZES = [10, 25, 50, 100]
+
 # --- DATAN LATAUS ---
-@st.cache_data
-def load_data():
+# Rakennetaan kerran per datatiedoston versio ja jaetaan kaikille istunnoille
+@st.cache_resource
+def load_data(version):
     try:
-        with open("structured_data.json", 'r', encoding='utf-8') as f:
-            return pd.DataFrame(json.load(f))
+        return DashboardData(load_frame(LIST_COLUMNS))
     except Exception as e:
         st.error(f"Virhe datan latauksessa: {e}")
-        return pd.DataFrame()
+        return DashboardData(pd.DataFrame())
+
+# Karttaan ja listaan tuleva näkymä: tyyppi ja valinnainen säderajaus (lentopaikka, km)
+def area_view(ac_type, area):
+    if area is None:
+        return data.view(ac_type)
+    return data.in_rows(ac_type, area_rows(version, *area))
+
+# Klusteroitu GeoJSON per (dataversio, tyyppi, rajaus, zoom)
+@st.cache_data(max_entries=128)
+def cluster_layer(version, ac_type, area, zoom):
+    return map_layer.cluster_features(area_view(ac_type, area), zoom)
+
+# Sijainti-indeksi ladataan kerran per indeksitiedoston versio. Indeksi kuuluu samaan
+# rikastusajoon kuin data vain, jos rivimäärät täsmäävät.
+@st.cache_resource
+def load_spatial(version, data_rows):
+    try:
+        index = load_spatial_index()
+    except Exception as e:
+        st.warning(f"Sijainti-indeksiä ei voitu ladata: {e}")
+        return None
+    return index if index is not None and index.count == data_rows else None
+
+@st.cache_data(max_entries=256)
+def area_rows(version, airfield, radius_km):
+    lat, lon = spatial.airfield(airfield)
+    return spatial.within(lat, lon, radius_km)[0]
+
+@st.cache_data(max_entries=128)
+def heat_layer(version, ac_type, area, zoom):
+    return map_layer.heat_points(spatial, area_view(ac_type, area), zoom)
+
+@st.cache_data(max_entries=64)
+def airfield_hotspots(version, ac_type, area):
+    return pd.Series(dict(spatial.airfield_counts(area_view(ac_type, area)['row'].to_numpy())[:10]), dtype='int64')
+
+# Käänteisindeksi ladataan kerran per indeksitiedoston versio
+@st.cache_resource
+def load_search(version):
+    try:
+        return load_search_index()
+    except Exception as e:
+        st.warning(f"Hakuindeksiä ei voitu ladata: {e}")
+        return None
+
+# Kaaviot piirretään kerran per (dataversio, tyyppi, rajaus) ja säilytetään PNG-tavuina
+@st.cache_data(max_entries=64)
+def location_chart(version, ac_type, area):
+    if area is None:
+        return charts.location_chart_png(data.location_counts(ac_type))
+    return charts.location_chart_png(data.view_counts(area_view(ac_type, area))["locations"],
+                                     title=f"Yleisimmät paikkakunnat ({area[0]} {area[1]} km)")
+
+@st.cache_data(max_entries=256)
+def report_details(version, row):
+    return load_details([row])[0]
 
 @st.cache_data
 def load_analyses():
-    try:
-        with open("ai_analyses.json", 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {}
+    return dashboard_data.load_analyses()
 
-df = load_data()
+version = data_version()
+data = load_data(version)
+df = data.df
 analyses = load_analyses()
+search = load_search(data_version(SEARCH_INDEX_FILE))
+spatial = load_spatial(data_version(SPATIAL_INDEX_FILE), len(df))
 
 # --- KÄYTTÖLIITTYMÄ ---
 
@@ -61,27 +121,28 @@ with col1:
     countries = ["Suomi"] 
     sel_country = st.selectbox("Valitse valtio", countries)
 with col2:
-    if not df.empty:
-        # Järjestetään aakkosiin
-        ac_types = ["Kaikki"] + sorted([x for x in df['aircraft_type'].unique() if x != "Kaikki"])
-    else:
-        ac_types = ["Ei dataa"]
+    ac_types = data.aircraft_types
     sel_aircraft = st.selectbox("Valitse ilma-alustyyppi", ac_types)
+with col3:
+    query = st.text_input("Hae raporttien tekstistä", placeholder="esim. jäätäminen tai OH-PJX",
+                          disabled=search is None,
+                          help="Kaikkien hakusanojen on löydyttävä. Taivutusmuodot (jäätämisen, jäätämistä) löytyvät samalla haulla.")
 
-# Datan suodatus
-filtered_df = df.copy()
-if sel_aircraft != "Kaikki":
-    filtered_df = filtered_df[filtered_df['aircraft_type'] == sel_aircraft]
+# Sijaintirajaus: tapaukset annetun säteen sisällä valitusta lentopaikasta
+col_field, col_radius, col_heat = st.columns([1, 1, 2])
+with col_field:
+    airfields = ["Ei rajausta"] + (sorted(spatial.airfield_names) if spatial is not None else [])
+    sel_airfield = st.selectbox("Rajaa lentopaikan ympäristöön", airfields, disabled=spatial is None,
+                                help="Vaatii rikastimen tuottaman sijainti-indeksin (spatial_index.npz).")
+with col_radius:
+    radius_km = st.slider("Säde (km)", min_value=5, max_value=200, value=20, step=5,
+                          disabled=sel_airfield == "Ei rajausta")
+with col_heat:
+    show_heat = st.checkbox("Näytä lämpökartta", value=False, disabled=spatial is None)
+area = (sel_airfield, radius_km) if sel_airfield != "Ei rajausta" else None
 
-# --- JÄRJESTÄMINEN (KORJATTU) ---
-if not filtered_df.empty:
-    # 1. Luodaan apusarake 'sort_year', jossa vuosi on numerona (eikä tekstinä)
-    # 'coerce' muuttaa virheet (N/A) NaN:ksi, fillna(0) muuttaa ne nollaksi
-    filtered_df['sort_year'] = pd.to_numeric(filtered_df['date'], errors='coerce').fillna(0)
-
-    # 2. Järjestetään ensisijaisesti VUODEN mukaan, toissijaisesti ID:n mukaan.
-    # Molemmat laskevasti (Uusin ensin).
-    filtered_df = filtered_df.sort_values(by=['sort_year', 'id'], ascending=[False, False])
+# Datan suodatus: valmiiksi järjestetyn kehyksen ryhmäindeksi, ei suodatusta eikä järjestämistä
+filtered_df = area_view(sel_aircraft, area)
 
 # --- PÄÄNÄKYMÄ ---
 
@@ -104,7 +165,10 @@ with col_left:
         # Kartan keskitys
         valid_coords = filtered_df.dropna(subset=['lat', 'lon'])
         
-        if not valid_coords.empty:
+        if area:
+            center = list(spatial.airfield(sel_airfield))
+            zoom = 9 if radius_km <= 20 else 7 if radius_km <= 80 else 6
+        elif not valid_coords.empty:
             if sel_aircraft == "Kaikki":
                 center = [65.0, 26.0]
                 zoom = 5
@@ -114,52 +178,112 @@ with col_left:
         else:
             center = [64.5, 26.0]
             zoom = 5
-            
-        m = folium.Map(location=center, zoom_start=zoom)
-        
-        for _, row in valid_coords.iterrows():
-            color = "red" if "onnettomuus" in row['id'].lower() else "blue"
-            
-            folium.Marker(
-                [row['lat'], row['lon']],
-                popup=folium.Popup(f"<b>{row['id']}</b><br>{row['date']}", max_width=300),
-                tooltip=f"{row['aircraft_type']} - {row['location_name']}",
-                icon=folium.Icon(color=color, icon="plane")
-            ).add_to(m)
-        
-        st_folium(m, height=400, use_container_width=True)
+
+        # Käytetään kartan edellistä näkymää (zoom + keskipiste), jotta klusterit vastaavat sitä
+        map_key = f"kartta_{sel_aircraft}_{area}"
+        map_state = st.session_state.get(map_key) or {}
+        if map_state.get("zoom"):
+            zoom = map_layer.clamp_zoom(map_state["zoom"])
+        if map_state.get("center"):
+            center = [map_state["center"]["lat"], map_state["center"]["lng"]]
+
+        # Karttakirjastot tuodaan vasta, kun karttapaneeli piirretään
+        from streamlit_folium import st_folium
+        heat = heat_layer(version, sel_aircraft, area, zoom) if show_heat else None
+        circle = (*spatial.airfield(sel_airfield), radius_km) if area else None
+        m = map_layer.build_map(cluster_layer(version, sel_aircraft, area, zoom), center, zoom, heat, circle)
+        st_folium(m, height=400, use_container_width=True, key=map_key, returned_objects=["zoom", "center"])
     else:
         st.write("Ei näytettäviä kohteita.")
 
 with col_right:
     st.markdown("### 📈 Tilastot")
     if not filtered_df.empty:
+        # Säderajauksen kanssa tilastot lasketaan rajatusta näkymästä
+        if area:
+            area_counts = data.view_counts(filtered_df)
+            loc_counts, year_counts = area_counts["locations"], area_counts["years"]
+        else:
+            loc_counts, year_counts = data.location_counts(sel_aircraft), data.year_counts(sel_aircraft)
+
         # Esimerkkigraafi: Tapaukset paikkakunnittain
-        loc_counts = filtered_df['location_name'].value_counts().head(10)
-        
         if not loc_counts.empty:
-            fig, ax = plt.subplots(figsize=(8, 4))
-            loc_counts.plot(kind='barh', ax=ax, color='#0f5499', edgecolor='black')
-            ax.set_title("Yleisimmät paikkakunnat (valittu ryhmä)")
-            ax.invert_yaxis() 
-            st.pyplot(fig)
+            st.image(location_chart(version, sel_aircraft, area), width="stretch")
         
         # Vuosijakauma
-        year_counts = filtered_df['date'].value_counts().sort_index()
         if not year_counts.empty:
              st.markdown("**Jakauma vuosittain:**")
              st.bar_chart(year_counts)
 
+        # Keskittymät: tapaukset lähimmän lentopaikan mukaan (enintään 20 km päässä)
+        if spatial is not None:
+            hotspots = airfield_hotspots(version, sel_aircraft, area)
+            if not hotspots.empty:
+                st.markdown("**Lentopaikkojen keskittymät (≤ 20 km):**")
+                st.bar_chart(hotspots, horizontal=True)
+
     else:
         st.write("Ei dataa tilastoihin.")
 
-# 3. Raporttilistaus
+# 3. Raporttilistaus (sivutettu: vain näkyvä sivu piirretään)
 st.divider()
-st.markdown(f"### 📄 Tutkintaselostukset ({len(filtered_df)} kpl)")
-
-for _, row in filtered_df.iterrows():
-    with st.expander(f"{row['date']} | {row['id']}"):
-        st.markdown(f"**Tyyppi:** {row['aircraft_type']}")
-        st.markdown(f"**Sijainti:** {row['location_name']}")
-        st.markdown(f"**Tiivistelmä:** _{row['summary']}_")
-        st.markdown(f"[Avaa raportti (Linkki OTKES/Google)]({row['url']})")
\ No newline at end of file
+results_df = None
+if query and search is not None:
+    search_start = time.perf_counter()
+    results_df = data.search_results(sel_aircraft, search.search(query))
+    if area:
+        results_df = results_df[results_df['row'].isin(area_rows(version, *area))]
+    search_ms = (time.perf_counter() - search_start) * 1000
+    total_reports = len(results_df)
+    st.markdown(f"### 📄 Tutkintaselostukset: \"{query}\" ({total_reports} osumaa, {search_ms:.0f} ms)")
+elif area:
+    results_df = filtered_df
+    total_reports = len(results_df)
+    st.markdown(f"### 📄 Tutkintaselostukset: {sel_airfield} {radius_km} km ({total_reports} kpl)")
+else:
+    total_reports = data.count(sel_aircraft)
+    st.markdown(f"### 📄 Tutkintaselostukset ({total_reports} kpl)")
+
+if total_reports:
+    col_page, col_size = st.columns([3, 1])
+    with col_size:
+        page_size = st.selectbox("Raportteja sivulla", PAGE_SIZES, index=1)
+    page_count = max(1, math.ceil(total_reports / page_size))
+    with col_page:
+        page = st.number_input(f"Sivu (1–{page_count})", min_value=1, max_value=page_count, value=1, step=1,
+                               key=f"sivu_{sel_aircraft}_{page_size}_{query}_{area}")
+    start = (page - 1) * page_size
+    if results_df is not None:
+        page_df = results_df.iloc[start:start + page_size]
+    else:
+        page_df = data.page(sel_aircraft, start, page_size)
+    st.caption(f"Näytetään {start + 1}–{start + len(page_df)} / {total_reports}. Valitse rivi nähdäksesi tiedot.")
+
+    selection = st.dataframe(
+        page_df[['date', 'id', 'aircraft_type', 'event_class', 'location_name']],
+        column_config={
+            "date": "Vuosi",
+            "id": "Tutkintaselostus",
+            "aircraft_type": "Tyyppi",
+            "event_class": "Luokka",
+            "location_name": "Sijainti",
+        },
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"raportit_{sel_aircraft}_{page_size}_{page}_{query}_{area}",
+    )
+
+    # Valitun raportin tiedot haetaan vasta pyydettäessä
+    selected_rows = selection.selection.rows
+    if selected_rows:
+        row = page_df.iloc[selected_rows[0]]
+        details = report_details(version, int(row['row']))
+        with st.container(border=True):
+            st.markdown(f"**{details.get('event_date') or row['date']} | {row['id']}**")
+            st.markdown(f"**Tyyppi:** {row['aircraft_type']} ({row['event_class']})")
+            if details.get('registrations'):
+                st.markdown(f"**Rekisteritunnus:** {', '.join(details['registrations'])}")
+            st.markdown(f"**Sijainti:** {row['location_name']}")
+            st.markdown(f"**Tiivistelmä:** _{details['summary']}_")
+            st.markdown(f"[Avaa raportti (Linkki OTKES/Google)]({details['url']})")
\ No newline at end of file
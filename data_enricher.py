@@ -3,26 +3,71 @@ import re
 import time
 import os
 import urllib.parse
-import google.generativeai as genai
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
+import argparse
+import asyncio
+import cProfile
+import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
 from google.api_core import exceptions
+from ai_client import AsyncGeminiClient
+import columnar_store
+from cache_store import CacheDB, CACHE_DB_FILE
+from gazetteer import Gazetteer, GAZETTEER_FILE
+from finnish_places import PlaceNormalizer, RULES_VERSION
+from json_stream import iter_json_records, JsonArrayWriter
+from run_stats import RunStats
+from search_index import SearchIndexBuilder, SEARCH_INDEX_FILE, term_counts
+from spatial_index import SpatialIndexBuilder, SPATIAL_INDEX_FILE
+from report_fields import extract_fields, FIELDS_VERSION
+from text_classifier import load_text_classifier, MODEL_FILE as TEXT_MODEL_FILE, DEFAULT_THRESHOLD as LOCAL_THRESHOLD
 
 # --- ASETUKSET ---
 INPUT_FILE = "otkes_db.json"
 OUTPUT_FILE = "structured_data.json"
 LOCATION_CACHE_FILE = "location_cache.json"
 AIRCRAFT_CACHE_FILE = "aircraft_cache.json"
+MANIFEST_FILE = "enrich_manifest.json"
+STATS_FILE = "enrich_run_stats.json"
 
-# Haetaan API-avain
-try:
-    import secrets
-    GOOGLE_API_KEY = secrets.GOOGLE_API_KEY
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp') 
-except ImportError:
-    print("VAROITUS: secrets.py puuttuu tai virheellinen. AI-tunnistus ei toimi.")
-    model = None
+# Ajon mittarit: vaiheajat, välimuistiosumat ja verkkokutsut (nollataan mainissa)
+STATS = RunStats()
+# Kirjastokäytössä (Enricher ilman stats-parametria) viivenäytteistä pidetään vain uusimmat
+ENRICHER_MAX_SAMPLES = 10000
+
+AI_MODEL_NAME = 'gemini-2.0-flash-exp'
+GEOCODER_USER_AGENT = "ilmailu_dashboard_project_v29_loose_search"
+
+# Verkkopalvelut luodaan vasta ajettaessa (init_services / Enricher.from_defaults),
+# jotta moduulin tuonti ei lue salaisuuksia eikä avaa yhteyksiä.
+model = None
+geolocator = None
+
+def create_model():
+    # Haetaan API-avain
+    try:
+        import secrets
+        import google.generativeai as genai
+        genai.configure(api_key=secrets.GOOGLE_API_KEY)
+        return genai.GenerativeModel(AI_MODEL_NAME)
+    except (ImportError, AttributeError):
+        print("VAROITUS: secrets.py puuttuu tai virheellinen. AI-tunnistus ei toimi.")
+        return None
+
+def create_geolocator():
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent=GEOCODER_USER_AGENT)
+
+def init_services(offline=False):
+    # Skriptiajon oletuspalvelut; jo asetettuja (esim. testimalli) ei korvata.
+    # Offline-tilassa geokoodaajaa ei luoda, jolloin geopyä ei tarvita.
+    global model, geolocator
+    if model is None:
+        model = create_model()
+    if geolocator is None and not offline:
+        geolocator = create_geolocator()
 
 # --- 1. KONETYYPIT ---
 AIRCRAFT_RULES = [
@@ -114,7 +159,7 @@ SYNONYMS = {
     "tampere": "Tampere", "pirkkala": "Tampere", "eftp": "Tampere",
     "jyväskylä": "Jyväskylä", "tikkakosk": "Jyväskylä", "efjy": "Jyväskylä",
     "oulu": "Oulu", "efou": "Oulu",
-    "rovanieme": "Rovaniemi", "rovaniemi": "Rovaniemi", "efro": "Rovaniemi",
+    "rovaniemi": "Rovaniemi", "efro": "Rovaniemi",
     "kuopio": "Kuopio", "efku": "Kuopio",
     "pori": "Pori", "efpo": "Pori",
     "vaasa": "Vaasa", "efva": "Vaasa",
@@ -167,7 +212,7 @@ SYNONYMS = {
     "kangasniemi": "Kangasniemi",
     "somero": "Somero", "hirsijärvi": "Somero",
     "kaarina": "Kaarina", "piikkiö": "Kaarina",
-    "taipalsaari": "Taipalsaari", "taipalsaare": "Taipalsaari",
+    "taipalsaari": "Taipalsaari",
     "kolari": "Kolari", "äkäs": "Kolari",
     "naantali": "Naantali", "rymättylä": "Naantali",
     "rääkkylä": "Rääkkylä",
@@ -175,7 +220,7 @@ SYNONYMS = {
     "eura": "Eura",
     "pelkosenniemi": "Pelkosenniemi",
     "huittinen": "Huittinen", "vampula": "Huittinen",
-    "valkeakoski": "Valkeakoski", "valkeakoske": "Valkeakoski",
+    "valkeakoski": "Valkeakoski",
     "inkoo": "Inkoo", "torbacka": "Inkoo",
     "laukaa": "Laukaa", "lievestuore": "Laukaa", "leppäve": "Laukaa",
     "mustasaari": "Mustasaari", "petsmo": "Mustasaari",
@@ -193,10 +238,10 @@ SYNONYMS = {
     "oripää": "Oripää",
     "jämsä": "Jämsä",
     "hattula": "Hattula",
-    "riihimäki": "Riihimäki", "riihimäe": "Riihimäki",
+    "riihimäki": "Riihimäki",
     "pertunmaa": "Pertunmaa",
-    "parainen": "Parainen", "paraisi": "Parainen",
-    "oulainen": "Oulainen", "oulaisi": "Oulainen",
+    "parainen": "Parainen",
+    "oulainen": "Oulainen",
     "viikki": "Helsinki", "laajasalo": "Helsinki",
     "pyhäselkä": "Joensuu",
     "vehmersalmi": "Kuopio", "tahkovuori": "Kuopio", "tahkovuore": "Tahkovuori", "nilsiä": "Kuopio",
@@ -204,15 +249,16 @@ SYNONYMS = {
     "kilpisjärvi": "Enontekiö",
     "närpiö": "Närpiö",
     "valkeala": "Valkeala",
-    "kerimäki": "Kerimäki", "kerimäe": "Kerimäki",
+    "kerimäki": "Kerimäki",
     "leppävesi": "Leppävesi",
-    "kirkkonummi": "Kirkkonummi", "kirkkonumme": "Kirkkonummi",
-    "tammisaari": "Tammisaari", "tammisaare": "Tammisaari",
-    "viitasaare": "Viitasaari", "viitasaari": "Viitasaari",
+    "kirkkonummi": "Kirkkonummi",
+    "tammisaari": "Tammisaari",
+    "viitasaari": "Viitasaari",
     "jaatila": "Jaatila"
 }
 
-geolocator = Nominatim(user_agent="ilmailu_dashboard_project_v29_loose_search")
+# Taivutetut muodot (Rovaniemellä, Kerimäeltä, Paraisilla) johdetaan säännöillä käsin kirjoitettujen varianttien sijaan
+PLACE_NORMALIZER = PlaceNormalizer(list(LOCATIONS) + list(dict.fromkeys(SYNONYMS.values())))
 
 def load_json(filename):
     if os.path.exists(filename):
@@ -230,68 +276,175 @@ def clean_soft_hyphens(text):
     return text.replace('\xad', '').replace('\u00ad', '').strip()
 
 # --- AI-TUNNISTUS (RETRY LOGIC) ---
-def identify_aircraft_with_ai(text, cache, report_id):
-    if report_id in cache:
-        return cache[report_id]
-    
-    if not model: return "Muu"
-
-    prompt = f"""
-    Tehtävä: Tunnista onnettomuudessa osallinen ilma-alustyyppi.
-    Teksti: "{text[:800]}"
-    
-    Palauta VAIN YKSI sana seuraavasta listasta (tai valmistaja):
+AI_LABEL_CHOICES = """
     - Cessna, Piper, Diamond, Cirrus, Beechcraft
     - Airbus, Boeing, ATR, Embraer, Bombardier, Saab
     - Helikopteri, Kuumailmapallo, Purjelentokone, Laskuvarjohyppy
     - Harraste/Ultrakevyt
-    - Muu (jos ei mikään yllä mainituista)
+    - Muu (jos ei mikään yllä mainituista)"""
+
+def build_aircraft_prompt(text):
+    return f"""
+    Tehtävä: Tunnista onnettomuudessa osallinen ilma-alustyyppi.
+    Teksti: "{text[:800]}"
+    
+    Palauta VAIN YKSI sana seuraavasta listasta (tai valmistaja):{AI_LABEL_CHOICES}
     """
+
+def normalize_ai_label(text):
+    result = text.strip().replace("\n", "").replace(".", "")
+    if not result or len(result) > 25: result = "Muu"
+    return result
+
+def identify_aircraft_with_ai(text, cache, report_id, ai_model=None, count_cache=True, stats=STATS):
+    # count_cache=False, kun osumat on jo laskettu ikkunakohtaisesti (Enricher.process)
+    if report_id in cache:
+        if count_cache: stats.incr("aircraft_cache_hit")
+        return cache[report_id]
+    if count_cache: stats.incr("aircraft_cache_miss")
+    
+    # Ei paluuta moduulin malliin: None tarkoittaa, että AI ei ole käytössä
+    if not ai_model: return "Muu"
+
+    prompt = build_aircraft_prompt(text)
     
     retries = 3
     wait_time = 10
     
     for attempt in range(retries):
         try:
-            response = model.generate_content(prompt)
-            result = response.text.strip().replace("\n", "").replace(".", "")
-            if len(result) > 25: result = "Muu"
+            stats.incr("gemini_calls")
+            response = ai_model.generate_content(prompt)
+            result = normalize_ai_label(response.text)
             
             print(f"    🤖 AI Tunnisti: {result}")
             cache[report_id] = result
-            time.sleep(5) 
+            with stats.stage("gemini_rate_limit_wait"):
+                time.sleep(5) 
             return result
             
         except exceptions.ResourceExhausted:
             print(f"    ⚠️ Kiintiö täynnä. Odotetaan {wait_time}s...")
-            time.sleep(wait_time)
+            stats.incr("gemini_retries")
+            with stats.stage("gemini_backoff_sleep"):
+                time.sleep(wait_time)
             wait_time *= 2 
         except Exception as e:
             print(f"    ⚠️ AI Virhe: {e}")
+            stats.incr("gemini_errors")
             return "Muu"
             
     return "Muu"
 
-def detect_aircraft_smart(title, full_text, ai_cache, report_id):
-    text_to_search = (clean_soft_hyphens(title) + " " + clean_soft_hyphens(full_text)[:3000]).lower()
-    for category, keywords, exclusions in AIRCRAFT_RULES:
-        for kw in keywords:
-            if re.search(kw, text_to_search):
-                is_excluded = False
-                for exc in exclusions:
-                    pattern = f"{exc}.{{0,30}}{kw}|{kw}.{{0,30}}{exc}"
-                    if re.search(pattern, text_to_search):
-                        is_excluded = True
-                        break
-                if not is_excluded:
+# --- AI-TUNNISTUS ERÄNÄ (asyncio + nopeusrajoitin) ---
+def build_batch_prompt(items):
+    # items: [(avain, teksti)], avaimet lyhyitä (R1, R2, ...) jotta vastaus on helppo jäsentää
+    reports = "\n".join(f'    [{key}] "{text[:500]}"' for key, text in items)
+    return f"""
+    Tehtävä: Tunnista jokaisen alla olevan raportin onnettomuudessa osallinen ilma-alustyyppi.
+    Raportit:
+{reports}
+    
+    Vastaa jokaiselle raportille omalla rivillään muodossa "R1: Tyyppi".
+    Tyypiksi VAIN YKSI sana seuraavasta listasta (tai valmistaja):{AI_LABEL_CHOICES}
+    """
+
+def parse_batch_labels(text, keys):
+    labels = {}
+    for m in re.finditer(r'^\W*(R\d+)\W*[:=\-]\s*(.+)$', text or "", re.MULTILINE):
+        if m.group(1) in keys:
+            labels[m.group(1)] = normalize_ai_label(m.group(2))
+    return labels
+
+async def identify_aircraft_batch_async(client, items, cache, batch_size=1):
+    # items: [(report_id, teksti)]. Tulokset tallennetaan suoraan välimuistiin.
+    items = [(rid, text) for rid, text in items if rid not in cache]
+    if batch_size <= 1:
+        prompts = [build_aircraft_prompt(text) for _, text in items]
+        results = await client.generate_many(prompts)
+        for (rid, _), result in zip(items, results):
+            if result is None: continue
+            cache[rid] = normalize_ai_label(result)
+            print(f"    🤖 AI Tunnisti: {cache[rid]} ({rid[:25]})")
+        return
+
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    keyed_batches = [[(f"R{n+1}", rid, text) for n, (rid, text) in enumerate(batch)] for batch in batches]
+    prompts = [build_batch_prompt([(key, text) for key, _, text in batch]) for batch in keyed_batches]
+    results = await client.generate_many(prompts)
+    for batch, result in zip(keyed_batches, results):
+        labels = parse_batch_labels(result, {key for key, _, _ in batch})
+        for key, rid, _ in batch:
+            # Puuttuvat vastaukset jätetään välimuistin ulkopuolelle (yritetään uudelleen myöhemmin)
+            if key in labels:
+                cache[rid] = labels[key]
+                print(f"    🤖 AI Tunnisti: {labels[key]} ({rid[:25]})")
+
+def run_coroutine(coro):
+    # asyncio.run ei toimi jo käynnissä olevan silmukan sisältä: silloin korutiini
+    # ajetaan omassa säikeessään ja omassa silmukassaan
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+# --- REGEX-LUOKITTELIJA (käännetään kerran) ---
+class AircraftClassifier:
+    def __init__(self, rules):
+        # Jokaiselle kategorialle yksi yhdistetty alternaatio. Poissulkevat
+        # kategoriat tarkistetaan avainsana kerrallaan, koska poissulku koskee
+        # ±30 merkin ikkunaa juuri osuneen avainsanan ympärillä.
+        self.rules = []
+        for category, keywords, exclusions in rules:
+            if exclusions:
+                exc = "|".join(exclusions)
+                checks = [
+                    (re.compile(kw), re.compile(f"(?:{exc}).{{0,30}}(?:{kw})|(?:{kw}).{{0,30}}(?:{exc})"))
+                    for kw in keywords
+                ]
+                self.rules.append((category, None, checks))
+            else:
+                combined = re.compile("|".join(f"(?:{kw})" for kw in keywords))
+                self.rules.append((category, combined, None))
+
+    def classify(self, text_lower):
+        for category, combined, checks in self.rules:
+            if combined is not None:
+                if combined.search(text_lower):
                     return category
-    return identify_aircraft_with_ai(clean_soft_hyphens(title) + " " + clean_soft_hyphens(full_text), ai_cache, report_id)
+                continue
+            for kw_re, exc_re in checks:
+                if kw_re.search(text_lower) and not exc_re.search(text_lower):
+                    return category
+        return None
+
+AIRCRAFT_CLASSIFIER = AircraftClassifier(AIRCRAFT_RULES)
+
+def classify_with_rules(title, full_text, classifier=None):
+    text_to_search = (clean_soft_hyphens(title) + " " + clean_soft_hyphens(full_text)[:3000]).lower()
+    return (classifier or AIRCRAFT_CLASSIFIER).classify(text_to_search)
+
+def detect_aircraft_smart(title, full_text, ai_cache, report_id, classifier=None, ai_model=None,
+                          text_classifier=None, threshold=LOCAL_THRESHOLD):
+    category = classify_with_rules(title, full_text, classifier)
+    if category:
+        return category
+    text = clean_soft_hyphens(title) + " " + clean_soft_hyphens(full_text)
+    # Paikallinen malli ennen AI:ta; epävarmat tapaukset kysytään AI:lta
+    if text_classifier is not None and report_id not in ai_cache:
+        label, confidence = text_classifier.predict(text)
+        if confidence >= threshold:
+            return label
+    return identify_aircraft_with_ai(text, ai_cache, report_id, ai_model)
 
 def clean_finnish_location(word):
     w = clean_soft_hyphens(word).lower()
     if not w: return ""
-    for syn, real_loc in SYNONYMS.items():
-        if syn == w: return real_loc
+    if w in SYNONYMS: return SYNONYMS[w]
+    normalized = PLACE_NORMALIZER.normalize(w)
+    if normalized: return normalized
     suffixes = [("ssa", ""), ("ssä", ""), ("lla", ""), ("llä", ""), ("lta", ""), ("ltä", ""), ("sta", ""), ("stä", ""), ("n", ""), ("a", ""), ("ä", "")]
     base = w
     for suf, rep in suffixes:
@@ -300,48 +453,94 @@ def clean_finnish_location(word):
             break
     return base.capitalize()
 
-def get_coordinates(place_name, cache):
+def get_coordinates(place_name, cache, gazetteer=None, offline=False, geocoder=None, stats=STATS):
     if not place_name: return None, None, "Tuntematon"
     clean_name = clean_finnish_location(place_name)
     if clean_name in LOCATIONS:
+        stats.incr("location_table_hit")
         loc = LOCATIONS[clean_name]
         return loc[0], loc[1], clean_name
-    if clean_name in cache:
-        val = cache[clean_name]
-        if val: return val[0], val[1], clean_name
+    # Paikallinen nimistö ennen välimuistia ja verkkohakua: katkenneet nimet (esim.
+    # "Helsinki-vanta") ratkeavat nimistön kautta eikä vanhan geokoodauksen mukaan
+    if gazetteer:
+        found = gazetteer.resolve(place_name)
+        if found:
+            stats.incr("gazetteer_hit")
+            return found
+    val = cache.get(clean_name) if clean_name in cache else False
+    stats.incr("location_cache_miss" if val is False else "location_cache_hit" if val else "location_cache_negative_hit")
+    if val: return val[0], val[1], clean_name
+    # Ilman annettua geokoodaajaa toimitaan kuten offline-tilassa
+    if val is None or offline or geocoder is None:
         return None, None, "Tuntematon"
+    stats.incr("nominatim_calls")
+    start = time.perf_counter()
     try:
-        location = geolocator.geocode(f"{clean_name}, Finland", timeout=10)
+        location = geocoder.geocode(f"{clean_name}, Finland", timeout=10)
+        stats.sample("nominatim_seconds", time.perf_counter() - start)
         if location:
             coords = (location.latitude, location.longitude)
             cache[clean_name] = coords
-            time.sleep(1.1)
+            with stats.stage("nominatim_rate_limit_wait"):
+                time.sleep(1.1)
             return coords[0], coords[1], clean_name
-        else: cache[clean_name] = None
-    except: pass
+        else:
+            print(f"    ⚠️ Paikkaa ei löytynyt: {clean_name}")
+            stats.incr("nominatim_not_found")
+            cache[clean_name] = None
+    except Exception as e:
+        print(f"    ⚠️ Geokoodausvirhe ({clean_name}): {e}")
+        stats.sample("nominatim_seconds", time.perf_counter() - start)
+        stats.incr("nominatim_errors")
     return None, None, "Tuntematon"
 
-def find_location_in_text(text):
+# --- PAIKKAHAKU (indeksi rakennetaan kerran) ---
+class LocationIndex:
+    def __init__(self, synonyms):
+        self.synonyms = synonyms
+        # Yksi alternaatio kaikista synonyymeistä pisin ensin, jolloin yksi
+        # finditer-läpikäynti antaa jokaisesta sanan alusta pisimmän osuman.
+        keys = sorted(synonyms.keys(), key=len, reverse=True)
+        self.pattern = self._compile(keys)
+        # "kemi" ohitetaan teksteissä, joissa puhutaan kemikaaleista
+        self.pattern_no_kemi = self._compile([k for k in keys if k != "kemi"])
+
+    @staticmethod
+    def _compile(keys):
+        return re.compile(r'\b(?:' + "|".join(re.escape(k) for k in keys) + ')')
+
+    def hits(self, text_lower):
+        pattern = self.pattern_no_kemi if "kemikaali" in text_lower else self.pattern
+        return [(m.start(), m.group(0)) for m in pattern.finditer(text_lower)]
+
+    def find(self, text_lower):
+        # Pisin osuma voittaa (kuten ennenkin), tasapelissä aikaisin kohta
+        best = None
+        for pos, key in self.hits(text_lower):
+            if best is None or len(key) > len(best):
+                best = key
+        return self.synonyms[best] if best else None
+
+def derived_location_keys():
+    # Johdetut vartalot, paitsi jos käsin kirjoitettu etuliite ohjaa muualle (esim. "leppäve" -> Laukaa)
+    keys = PLACE_NORMALIZER.search_keys([name for key, name in SYNONYMS.items() if key == name.lower()])
+    return {
+        stem: name for stem, name in keys.items()
+        if not any(stem.startswith(key) and target != name for key, target in SYNONYMS.items())
+    }
+
+# Käsin kirjoitetut synonyymit voittavat johdetut vartalot
+LOCATION_INDEX = LocationIndex({**derived_location_keys(), **SYNONYMS})
+
+def find_location_in_text(text, location_index=None):
     text = clean_soft_hyphens(text)
-    text_lower = text[:1000].lower()
-    sorted_keys = sorted(SYNONYMS.keys(), key=len, reverse=True)
-    for key in sorted_keys:
-        if re.search(r'\b' + re.escape(key), text_lower):
-            if key == "kemi" and "kemikaali" in text_lower: continue
-            return SYNONYMS[key]
-    return None
-
-def extract_location_from_title(title):
+    return (location_index or LOCATION_INDEX).find(text[:1000].lower())
+
+def extract_location_from_title(title, location_index=None):
     clean_title = clean_soft_hyphens(title)
     clean = re.sub(r'^[A-Z0-9/]+[- ]?\w*\s+', '', clean_title)
     clean = re.sub(r'\d{1,2}\.\d{1,2}\.\d{4}.*', '', clean)
-    title_lower = clean.lower()
-    sorted_keys = sorted(SYNONYMS.keys(), key=len, reverse=True)
-    for key in sorted_keys:
-        if re.search(r'\b' + re.escape(key), title_lower):
-            if key == "kemi" and "kemikaali" in title_lower: continue
-            return SYNONYMS[key]
-    return None
+    return (location_index or LOCATION_INDEX).find(clean.lower())
 
 # --- UUSI HAKU: Löysä Google-haku ---
 def create_smart_link(report_id):
@@ -356,21 +555,10 @@ def create_smart_link(report_id):
     
     return f"https://www.google.com/search?q={safe_query}"
 
-def main():
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        print("Datatiedostoa ei löydy.")
-        return
-
-    location_cache = load_json(LOCATION_CACHE_FILE)
-    aircraft_cache = load_json(AIRCRAFT_CACHE_FILE) 
-    enriched_data = []
+# --- PUTKI: puhtaat CPU-vaiheet ja koordinaattori ---
+def iter_report_entries(data):
+    # Suodatus ja duplikaattien poisto tehdään aina järjestyksessä koordinaattorissa
     processed_roots = set()
-    
-    print("Prosessoidaan dataa (V29 - Loose Search)...")
-    
     for entry in data:
         raw_id = clean_soft_hyphens(entry['id'])
         
@@ -382,46 +570,420 @@ def main():
         id_root = raw_id.lower().replace(".pdf", "").replace(".txt", "").strip()
         if id_root in processed_roots: continue
         processed_roots.add(id_root)
-             
-        title_id = raw_id
-        content_text = clean_soft_hyphens(entry['text'])
-        
-        ac_type = detect_aircraft_smart(title_id, content_text, aircraft_cache, raw_id)
-        
-        extracted_place = extract_location_from_title(title_id)
-        lat, lon, final_loc_name = get_coordinates(extracted_place, location_cache)
-        if not lat:
-            text_place = find_location_in_text(content_text)
-            if text_place:
-                 lat, lon, final_loc_name = get_coordinates(text_place, location_cache)
-        if not final_loc_name: final_loc_name = "Tuntematon"
+        yield id_root, entry
+
+def entry_hash(entry):
+    payload = json.dumps([entry['id'], entry['text']], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def pipeline_fingerprint(extra=None):
+    # Sääntöjen tai paikkataulujen muutos mitätöi koko manifestin (extra: esim. paikallisen mallin tunniste)
+    payload = json.dumps([AIRCRAFT_RULES, LOCATIONS, SYNONYMS, RULES_VERSION, FIELDS_VERSION] + (extra or []), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
+def record_root(record):
+    return record["id"].lower().replace(".pdf", "").replace(".txt", "").strip()
+
+def prepare_entry(entry, classifier=None, location_index=None):
+    # Ei välimuisteja eikä verkkoa: voidaan ajaa prosessipoolissa. Vaiheajat
+    # palautetaan tuloksen mukana, koska työprosessin STATS ei näy koordinaattorille.
+    timings = {}
+    start = time.perf_counter()
+    title_id = clean_soft_hyphens(entry['id'])
+    content_text = clean_soft_hyphens(entry['text'])
+    timings["cleaning"], start = time.perf_counter() - start, time.perf_counter()
+
+    ac_type = classify_with_rules(title_id, content_text, classifier)
+    timings["regex_classification"], start = time.perf_counter() - start, time.perf_counter()
+
+    # Tapahtumapäivä (pp.kk.vvvv), tunnukset ja luokka yhdellä läpikäynnillä. Vuosi
+    # tapahtumapäivästä; otsikon ensimmäinen vuosiluku on usein raportin numerointivuosi.
+    fields = extract_fields(title_id, content_text)
+    if fields["event_date"]:
+        date_str = fields["event_date"][:4]
+    else:
         year_match = re.search(r'20\d{2}|19\d{2}', title_id)
         date_str = year_match.group(0) if year_match else "N/A"
+    timings["field_extraction"], start = time.perf_counter() - start, time.perf_counter()
 
-        new_entry = {
-            "id": title_id,
-            "date": date_str,
-            "aircraft_type": ac_type,
-            "country": "Suomi", 
-            "location_name": final_loc_name,
-            "lat": lat,
-            "lon": lon,
-            "url": create_smart_link(title_id), # Löysä haku
-            "summary": content_text[:300].replace('\n', ' ') + "..." 
-        }
-        enriched_data.append(new_entry)
-        
-        source = "AI" if raw_id in aircraft_cache else "Regex"
-        print(f"  > {title_id[:25]}... -> [{ac_type}] ({source}) @ {final_loc_name}")
+    title_place = extract_location_from_title(title_id, location_index)
+    timings["title_location"], start = time.perf_counter() - start, time.perf_counter()
+    text_place = find_location_in_text(content_text, location_index)
+    timings["text_location"], start = time.perf_counter() - start, time.perf_counter()
+    # Hakuindeksin termit koko puhdistetusta tekstistä (tiivistelmä on vain 300 merkkiä)
+    terms = term_counts(title_id + " " + content_text)
+    timings["indexing"] = time.perf_counter() - start
 
-    save_json(location_cache, LOCATION_CACHE_FILE)
-    save_json(aircraft_cache, AIRCRAFT_CACHE_FILE) 
-    
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(enriched_data, f, ensure_ascii=False, indent=4)
+    return {
+        "id": title_id,
+        "ac_type": ac_type,
+        "ac_source": "Regex" if ac_type else None,
+        # AI-tunnistus käyttää vain tekstin alkua
+        "ai_text": None if ac_type else (title_id + " " + content_text)[:800],
+        "title_place": title_place,
+        "text_place": text_place,
+        "date": date_str,
+        "fields": fields,
+        "url": create_smart_link(title_id), # Löysä haku
+        "summary": content_text[:300].replace('\n', ' ') + "...",
+        "timings": timings,
+        "terms": terms,
+    }
+
+def finish_entry(prepared, location_cache, aircraft_cache, gazetteer=None, offline=False, geocoder=None, ai_model=None, stats=STATS):
+    # Välimuistit, Gemini ja geokoodaus pysyvät yhdessä prosessissa
+    stats.merge_timings(prepared.get("timings", {}))
+    title_id = prepared["id"]
+    ac_type = prepared["ac_type"]
+    if not ac_type:
+        with stats.stage("ai_classification"):
+            ac_type = identify_aircraft_with_ai(prepared["ai_text"], aircraft_cache, title_id, ai_model, count_cache=False, stats=stats)
+
+    with stats.stage("geocoding"):
+        lat, lon, final_loc_name = get_coordinates(prepared["title_place"], location_cache, gazetteer, offline, geocoder, stats)
+        if not lat:
+            text_place = prepared["text_place"]
+            if text_place:
+                 lat, lon, final_loc_name = get_coordinates(text_place, location_cache, gazetteer, offline, geocoder, stats)
+    if not final_loc_name: final_loc_name = "Tuntematon"
+
+    fields = prepared["fields"]
+    return {
+        "id": title_id,
+        "date": prepared["date"],
+        "event_date": fields["event_date"],
+        "aircraft_type": ac_type,
+        "country": "Suomi", 
+        "location_name": final_loc_name,
+        "lat": lat,
+        "lon": lon,
+        "registrations": fields["registrations"],
+        "report_class": fields["report_class"],
+        "event_class": fields["event_class"],
+        "url": prepared["url"],
+        "summary": prepared["summary"]
+    }
+
+# --- KIRJASTORAJAPINTA ---
+class Enricher:
+    # Pysyvä rikastin palveluille: geokoodaaja, AI-malli, luokittelija ja välimuistit
+    # annetaan parametreina. Välimuistiksi kelpaa tavallinen dict tai cache_store.CacheStore (CacheDB.namespace).
+    def __init__(self, geocoder=None, model=None, classifier=AIRCRAFT_CLASSIFIER, location_index=LOCATION_INDEX,
+                 location_cache=None, aircraft_cache=None, gazetteer=None, offline=False,
+                 ai_rpm=15, ai_concurrency=4, ai_batch=1, text_classifier=None, local_threshold=LOCAL_THRESHOLD,
+                 stats=None):
+        self.geocoder = geocoder
+        self.model = model
+        self.classifier = classifier
+        # Valinnainen text_classifier.HashedTextClassifier regexin ja AI:n välissä
+        self.text_classifier = text_classifier
+        self.local_threshold = local_threshold
+        self.location_index = location_index
+        self.location_cache = {} if location_cache is None else location_cache
+        self.aircraft_cache = {} if aircraft_cache is None else aircraft_cache
+        self.gazetteer = gazetteer
+        self.offline = offline
+        self.ai_rpm = ai_rpm
+        self.ai_concurrency = ai_concurrency
+        self.ai_batch = ai_batch
+        # Oma mittaristo jokaiselle rikastimelle; skriptiajo antaa moduulin STATS-olion.
+        # Pitkäikäinen käyttäjä lukee ja nollaa sen itse (stats.summary(), stats.reset()).
+        self.stats = RunStats(max_samples=ENRICHER_MAX_SAMPLES) if stats is None else stats
+
+    @classmethod
+    def from_defaults(cls, **kwargs):
+        # Samat palvelut kuin skriptiajossa: Gemini, Nominatim ja paikallinen nimistö
+        if "gazetteer" not in kwargs:
+            gazetteer = Gazetteer.load(GAZETTEER_FILE, normalize=clean_finnish_location)
+            gazetteer.add_source(LOCATIONS, "lentopaikka")
+            kwargs["gazetteer"] = gazetteer
+        if "model" not in kwargs:
+            kwargs["model"] = create_model()
+        if "geocoder" not in kwargs and not kwargs.get("offline"):
+            kwargs["geocoder"] = create_geolocator()
+        if "text_classifier" not in kwargs:
+            kwargs["text_classifier"] = load_text_classifier(TEXT_MODEL_FILE)
+        return cls(**kwargs)
+
+    def _prepare_func(self):
+        if self.classifier is AIRCRAFT_CLASSIFIER and self.location_index is LOCATION_INDEX:
+            return prepare_entry
+        return partial(prepare_entry, classifier=self.classifier, location_index=self.location_index)
+
+    def process(self, entries, pool=None):
+        # entries on jo suodatettu (iter_report_entries); palauttaa [(prepared, record)] samassa järjestyksessä
+        prepared, ai_items = self._prepare(entries, pool)
+        if self._needs_ai(ai_items):
+            with self.stats.stage("ai_classification"):
+                run_coroutine(self._classify_with_ai(ai_items))
+        return self._finish(prepared)
+
+    async def process_async(self, entries, pool=None):
+        # Sama kuin process, kun kutsuja on jo tapahtumasilmukassa (async-palvelin, notebook)
+        prepared, ai_items = self._prepare(entries, pool)
+        if self._needs_ai(ai_items):
+            with self.stats.stage("ai_classification"):
+                await self._classify_with_ai(ai_items)
+        # Geokoodaus odottaa Nominatimin nopeusrajaa: ei pysäytetä silmukkaa sen ajaksi
+        return await asyncio.to_thread(self._finish, prepared)
+
+    def _prepare(self, entries, pool):
+        prepare = self._prepare_func()
+        with self.stats.stage("prepare_wall"):
+            if pool:
+                # map säilyttää syötteen järjestyksen
+                prepared = pool.map(prepare, entries, chunksize=16)
+            else:
+                prepared = list(map(prepare, entries))
+
+        if self.text_classifier is not None:
+            with self.stats.stage("local_classification"):
+                self.classify_locally(prepared)
+
+        # Regexillä tunnistamattomat kysytään AI:lta rinnakkain ennen viimeistelyä
+        ai_items = [(p["id"], p["ai_text"]) for p in prepared if not p["ac_type"]]
+        # Välimuistiosumat lasketaan vain tässä: viimeistely lukee samat vastaukset uudelleen
+        cached = sum(1 for rid, _ in ai_items if rid in self.aircraft_cache)
+        self.stats.incr("aircraft_cache_hit", cached)
+        self.stats.incr("aircraft_cache_miss", len(ai_items) - cached)
+        return prepared, ai_items
+
+    def _needs_ai(self, ai_items):
+        return self.model and any(rid not in self.aircraft_cache for rid, _ in ai_items)
+
+    async def _classify_with_ai(self, ai_items):
+        client = AsyncGeminiClient(self.model, requests_per_minute=self.ai_rpm, max_concurrency=self.ai_concurrency, stats=self.stats)
+        await identify_aircraft_batch_async(client, ai_items, self.aircraft_cache, batch_size=self.ai_batch)
+
+    def _finish(self, prepared):
+        return [(p, finish_entry(p, self.location_cache, self.aircraft_cache, self.gazetteer, self.offline,
+                                 self.geocoder, self.model, self.stats))
+                for p in prepared]
+
+    def classify_locally(self, prepared):
+        # Regexin ohittamat: varma ennuste hyväksytään, muut jäävät AI:lle.
+        # AI:n aiempi vastaus välimuistissa menee mallin edelle.
+        for p in prepared:
+            if p["ac_type"] or p["id"] in self.aircraft_cache:
+                continue
+            start = time.perf_counter()
+            label, confidence = self.text_classifier.predict(p["ai_text"])
+            self.stats.sample("local_model_seconds", time.perf_counter() - start)
+            if confidence >= self.local_threshold:
+                p["ac_type"], p["ac_source"] = label, "Malli"
+                self.stats.incr("local_model_accepted")
+            else:
+                self.stats.incr("local_model_escalated")
+
+    def enrich_batch(self, entries):
+        # Raakaraportit ({"id", "text"}) -> rikastetut tietueet; suodatus ja duplikaatit kuten skriptissä
+        todo = [entry for _, entry in iter_report_entries(entries)]
+        return [record for _, record in self.process(todo)]
+
+    async def enrich_batch_async(self, entries):
+        todo = [entry for _, entry in iter_report_entries(entries)]
+        return [record for _, record in await self.process_async(todo)]
+
+    def enrich_stream(self, entries, window=256):
+        # Generaattori: luetaan ja rikastetaan ikkuna kerrallaan
+        for batch in iter_windows((entry for _, entry in iter_report_entries(entries)), window):
+            for _, record in self.process(batch):
+                yield record
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OTKES-datan rikastus")
+    parser.add_argument("--input", default=INPUT_FILE,
+                        help="Syötetiedosto: JSON-taulukko tai JSON Lines (luetaan virtana)")
+    parser.add_argument("--window", type=int, default=256,
+                        help="Kerralla muistissa käsiteltävien raporttien määrä")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Prosessien määrä CPU-vaiheille (1 = ajetaan sarjassa)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Käsittele vain uudet tai muuttuneet raportit (manifestin perusteella)")
+    parser.add_argument("--cache", choices=["sqlite", "json"], default="sqlite",
+                        help="Välimuistin tallennus: SQLite-tietokanta tai vanhat JSON-tiedostot")
+    parser.add_argument("--negative-ttl-days", type=float, default=30,
+                        help="Kuinka kauan 'ei löytynyt' -geokoodaustulokset ovat voimassa (SQLite)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Ei verkkogeokoodausta: paikat ratkaistaan vain paikallisesta nimistöstä")
+    parser.add_argument("--ai-batch", type=int, default=1,
+                        help="Montako raporttia yhteen AI-kyselyyn pakataan")
+    parser.add_argument("--ai-rpm", type=int, default=15,
+                        help="AI-kyselyjen enimmäismäärä minuutissa")
+    parser.add_argument("--ai-concurrency", type=int, default=4,
+                        help="Samanaikaisten AI-kyselyjen enimmäismäärä")
+    parser.add_argument("--local-model", default=TEXT_MODEL_FILE,
+                        help="Paikallinen konetyyppimalli (text_classifier.py train); käytetään, jos tiedosto on olemassa")
+    parser.add_argument("--no-local-model", action="store_true",
+                        help="Ohita paikallinen malli: regexin ohittamat menevät suoraan AI:lle")
+    parser.add_argument("--local-threshold", type=float, default=LOCAL_THRESHOLD,
+                        help="Paikallisen mallin varmuusraja, jonka alittavat kysytään AI:lta")
+    parser.add_argument("--stats", default=STATS_FILE,
+                        help="Ajon yhteenveto (vaiheajat, välimuistiosumat, verkkokutsut) JSON-tiedostoon")
+    parser.add_argument("--profile", metavar="TIEDOSTO",
+                        help="Tallenna cProfile-profiili annettuun tiedostoon")
+    return parser.parse_args()
+
+def iter_windows(items, size):
+    # Pilkotaan virta kiinteän kokoisiin ikkunoihin: muistissa on kerrallaan vain yksi ikkuna
+    iterator = iter(items)
+    while True:
+        window = list(itertools.islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+def enrich(args):
+    if not os.path.exists(args.input):
+        print("Datatiedostoa ei löydy.")
+        return None
+
+    cache_db = None
+    if args.cache == "sqlite":
+        # Tulokset tallentuvat erissä ajon aikana; keskeytys ei hävitä jo tehtyjä hakuja
+        cache_db = CacheDB(CACHE_DB_FILE)
+        location_cache = cache_db.namespace("location", negative_ttl=args.negative_ttl_days * 86400)
+        aircraft_cache = cache_db.namespace("aircraft")
+        for store, filename in ((location_cache, LOCATION_CACHE_FILE), (aircraft_cache, AIRCRAFT_CACHE_FILE)):
+            imported = store.import_json(filename)
+            if imported:
+                print(f"Tuotiin {imported} merkintää tiedostosta {filename} välimuistikantaan.")
+    else:
+        location_cache = load_json(LOCATION_CACHE_FILE)
+        aircraft_cache = load_json(AIRCRAFT_CACHE_FILE) 
+
+    gazetteer = Gazetteer.load(GAZETTEER_FILE, normalize=clean_finnish_location)
+    gazetteer.add_source(LOCATIONS, "lentopaikka")
+    if args.offline:
+        print(f"Offline-geokoodaus: {len(gazetteer)} paikkaa nimistössä.")
+    text_classifier = None if args.no_local_model else load_text_classifier(args.local_model)
+    if text_classifier is not None:
+        print(f"Paikallinen malli: {args.local_model} ({len(text_classifier.labels)} luokkaa, varmuusraja {args.local_threshold}).")
+    enricher = Enricher(geocoder=None if args.offline else geolocator, model=model,
+                        location_cache=location_cache, aircraft_cache=aircraft_cache,
+                        gazetteer=gazetteer, offline=args.offline, ai_rpm=args.ai_rpm,
+                        ai_concurrency=args.ai_concurrency, ai_batch=args.ai_batch,
+                        text_classifier=text_classifier, local_threshold=args.local_threshold, stats=STATS)
+
+    fingerprint = pipeline_fingerprint([text_classifier.fingerprint, args.local_threshold] if text_classifier else None)
+    manifest = {"pipeline": fingerprint, "entries": {}}
+    previous = {}
+    if args.incremental:
+        old_manifest = load_json(MANIFEST_FILE)
+        if old_manifest.get("pipeline") == fingerprint and os.path.exists(OUTPUT_FILE):
+            old_hashes = old_manifest.get("entries", {})
+            for record in iter_json_records(OUTPUT_FILE):
+                root = record_root(record)
+                if root in old_hashes:
+                    previous[root] = (old_hashes[root], record)
+        else:
+            print("Manifesti puuttuu tai säännöt muuttuneet, käsitellään kaikki.")
+
+    def iter_work():
+        # Jokaiselle raportille joko edellisen ajon tulos tai None (käsitellään)
+        for id_root, entry in iter_report_entries(iter_json_records(args.input)):
+            h = entry_hash(entry)
+            manifest["entries"][id_root] = h
+            old = previous.pop(id_root, None)
+            yield entry, old[1] if old and old[0] == h else None
+
+    print("Prosessoidaan dataa (V29 - Loose Search)...")
+
+    reused = 0
+    search_builder = SearchIndexBuilder()
+    spatial_builder = SpatialIndexBuilder()
+    pool = Pool(args.workers) if args.workers > 1 else None
+    try:
+        # JSON suljetaan ensin ja sarakemuotoinen tiedosto viimeisenä: dashboard_data.source_file
+        # käyttää sitä vain, jos se ei ole JSONia vanhempi
+        with columnar_store.ColumnarWriter() as columnar, JsonArrayWriter(OUTPUT_FILE) as output:
+            windows = iter_windows(iter_work(), args.window)
+            while True:
+                # Lukuvaihe sisältää jäsennyksen, suodatuksen ja tiivisteet
+                with STATS.stage("read"):
+                    window = next(windows, None)
+                if window is None:
+                    break
+                todo = [entry for entry, record in window if record is None]
+                processed = iter(enricher.process(todo, pool))
+                del todo
+
+                records = []
+                for entry, record in window:
+                    if record is not None:
+                        reused += 1
+                        records.append(record)
+                        with STATS.stage("indexing"):
+                            search_builder.add(record["id"], term_counts(clean_soft_hyphens(entry['id']) + " " + clean_soft_hyphens(entry['text'])))
+                        continue
+
+                    prepared_entry, new_entry = next(processed)
+                    records.append(new_entry)
+                    with STATS.stage("indexing"):
+                        search_builder.add(new_entry["id"], prepared_entry["terms"])
+                    
+                    title_id = new_entry["id"]
+                    source = prepared_entry["ac_source"] or "AI"
+                    print(f"  > {title_id[:25]}... -> [{new_entry['aircraft_type']}] ({source}) @ {new_entry['location_name']}")
+
+                with STATS.stage("serialization"):
+                    for record in records:
+                        output.write(record)
+                        spatial_builder.add(record["lat"], record["lon"])
+                    # Sarakemuotoinen kopio dashboardin muistikartoitettua latausta varten
+                    columnar.write(records)
+            count = output.count
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if cache_db:
+            cache_db.close()
+
+    with STATS.stage("serialization"):
+        search_builder.save(SEARCH_INDEX_FILE)
+        # Ruudukkoindeksi säde- ja tiheyskyselyille sekä lähimmän lentopaikan kohdistus
+        spatial_builder.save(LOCATIONS, SPATIAL_INDEX_FILE)
+        if not cache_db:
+            save_json(location_cache, LOCATION_CACHE_FILE)
+            save_json(aircraft_cache, AIRCRAFT_CACHE_FILE) 
+        save_json(manifest, MANIFEST_FILE)
     
-    print(f"\nValmis! {len(enriched_data)} tapausta.")
+    STATS.incr("reports", count)
+    STATS.incr("reports_reused", reused)
+    if args.incremental:
+        print(f"Uusia tai muuttuneita: {count - reused}, ennallaan: {reused}")
+    print(f"\nValmis! {count} tapausta.")
+    return count
+
+def print_stats_summary(summary):
+    stages = summary["stages"]
+    counters = summary["counters"]
+    print(f"Ajoaika {summary['wall_seconds']:.1f}s. Hitaimmat vaiheet: " +
+          ", ".join(f"{name} {seconds:.1f}s" for name, seconds in sorted(stages.items(), key=lambda x: -x[1])[:3]))
+    print(f"AI-kutsut {counters.get('gemini_calls', 0)} (uusinnat {counters.get('gemini_retries', 0)}, "
+          f"odotus {stages.get('gemini_backoff_sleep', 0):.0f}s), Nominatim-kutsut {counters.get('nominatim_calls', 0)}")
+
+def main():
+    args = parse_args()
+    STATS.reset()
+    init_services(offline=args.offline)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        count = enrich(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"Profiili tallennettu: {args.profile} (python -m pstats {args.profile})")
+    if count is None:
+        return
+    summary = STATS.summary()
+    save_json(summary, args.stats)
+    print_stats_summary(summary)
+    print(f"Ajon yhteenveto: {args.stats}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
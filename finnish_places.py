@@ -0,0 +1,104 @@
+import re
+from functools import lru_cache
+
+# Kasvata, kun sääntöjä muutetaan (mitätöi rikastimen manifestin)
+RULES_VERSION = 1
+
+VOWELS = "aeiouyäö"
+
+# Sijapäätteet pisin ensin: paikallissijat, genetiivi, partitiivi, essiivi, translatiivi, abessiivi
+CASE_ENDINGS = [
+    "seen", "ssa", "ssä", "sta", "stä", "lla", "llä", "lta", "ltä", "lle", "ksi", "tta", "ttä", "ten",
+    "hin", "han", "hen", "hon", "hun", "hyn", "hän", "hön",
+    "na", "nä", "ta", "tä", "n", "a", "ä", "",
+]
+
+# Astevaihtelu vahvasta heikkoon, pisin vahva muoto ensin
+GRADATION = [
+    ("kk", "k"), ("pp", "p"), ("tt", "t"),
+    ("nk", "ng"), ("mp", "mm"), ("nt", "nn"), ("lt", "ll"), ("rt", "rr"), ("ht", "hd"),
+    ("lk", "l"), ("rk", "r"), ("hk", "h"),
+    ("k", ""), ("p", "v"), ("t", "d"),
+]
+
+_LAST_SYLLABLE = re.compile(f"([^{VOWELS}]+)([{VOWELS}]+)$")
+
+def weak_grade(stem):
+    m = _LAST_SYLLABLE.search(stem)
+    if not m:
+        return None
+    consonants, vowels = m.group(1), m.group(2)
+    # Vain lyhyen loppuvokaalin edellä (Hyvinkää, Enontekiö eivät vaihtele)
+    if len(vowels) != 1:
+        return None
+    for strong, weak in GRADATION:
+        # Yksittäinen k/p/t vaihtelee vain vokaalien välissä (ei esim. Valkeakoski)
+        if consonants == strong or (len(strong) == 2 and consonants.endswith(strong)):
+            return stem[:m.start()] + consonants[:-len(strong)] + weak + vowels
+    return None
+
+def inflection_stems(nominative):
+    # Nominatiivista johdetut taivutusvartalot, esim. Rovaniemi -> rovanieme,
+    # Kerimäki -> kerimäe, Utti -> uti, Varkaus -> varkaude, Parainen -> paraisi
+    word = nominative.lower()
+    stems = {word}
+    if word.endswith("nen"):
+        stems |= {word[:-3] + "se", word[:-3] + "si", word[:-3] + "s"}
+    elif word.endswith("us") or word.endswith("ys"):
+        stems.add(word[:-1] + "de")
+    elif word.endswith("si"):
+        stems |= {word[:-2] + "de", word[:-2] + "te"}
+    if word.endswith("i"):
+        stems.add(word[:-1] + "e")
+    elif word.endswith("e"):
+        stems.add(word + "e")
+    for stem in list(stems):
+        weak = weak_grade(stem)
+        if weak:
+            stems.add(weak)
+    stems.discard("")
+    return stems
+
+def strip_endings(word):
+    # Kaikki mahdolliset vartalot, joista sana voi olla taivutettu
+    bases = []
+    for ending in CASE_ENDINGS:
+        if word.endswith(ending) and len(word) > len(ending) + 1:
+            bases.append(word[:-len(ending)] if ending else word)
+    # Illatiivi pitkällä vokaalilla: Poriin, Ouluun
+    if len(word) > 3 and word.endswith("n") and word[-2] in VOWELS and word[-2] == word[-3]:
+        bases.append(word[:-2])
+    return bases
+
+# --- PAIKANNIMIEN NORMALISOINTI ---
+class PlaceNormalizer:
+    def __init__(self, names, memo_size=4096):
+        # Käänteisindeksi vartalo -> kanoninen nimi. Nominatiivit ensin, jotta
+        # johdettu vartalo ei koskaan peitä toisen paikan perusmuotoa.
+        self.index = {}
+        for name in names:
+            self.index.setdefault(name.lower(), name)
+        for name in names:
+            for stem in inflection_stems(name):
+                self.index.setdefault(stem, name)
+        self.normalize = lru_cache(maxsize=memo_size)(self._normalize)
+
+    def _normalize(self, word):
+        w = word.lower()
+        if w in self.index:
+            return self.index[w]
+        for base in strip_endings(w):
+            if base in self.index:
+                return self.index[base]
+        return None
+
+    def search_keys(self, names, min_length=7):
+        # Tekstihaun lisäavaimet: pitkien nimien taivutusvartalot (lyhyet tuottaisivat vääriä osumia)
+        keys = {}
+        for name in names:
+            if len(name) < min_length:
+                continue
+            for stem in inflection_stems(name):
+                if self.index.get(stem) == name:
+                    keys[stem] = name
+        return keys
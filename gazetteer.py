@@ -0,0 +1,140 @@
+import argparse
+import csv
+import difflib
+import json
+import os
+
+GAZETTEER_FILE = "gazetteer.json"
+
+# GeoNames-koodit, jotka otetaan mukaan valinnaisesta FI.txt-vedoksesta
+GEONAMES_KINDS = {"ADM3": "kunta", "PPLA": "kunta", "PPLA2": "kunta", "PPLA3": "kunta", "PPL": "kylä", "AIRP": "lentopaikka", "AIRF": "lentopaikka"}
+
+# --- PAIKANNIMISTÖ (offline-geokoodaus) ---
+class Gazetteer:
+    def __init__(self, places=None, aliases=None, normalize=None, fuzzy_cutoff=0.85):
+        # places: {nimi: [lat, lon, laji]}, aliases: {alias (pienillä): nimi}
+        self.places = {}
+        self.index = {}
+        self.aliases = {}
+        self.normalize = normalize
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._memo = {}
+        for name, (lat, lon, kind) in (places or {}).items():
+            self.add(name, lat, lon, kind)
+        for alias, name in (aliases or {}).items():
+            self.add_alias(alias, name)
+
+    @classmethod
+    def load(cls, filename=GAZETTEER_FILE, **kwargs):
+        if not os.path.exists(filename):
+            return cls(**kwargs)
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get("places"), data.get("aliases"), **kwargs)
+
+    def save(self, filename=GAZETTEER_FILE):
+        data = {
+            "places": {name: list(value) for name, value in sorted(self.places.items())},
+            "aliases": dict(sorted(self.aliases.items())),
+        }
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    def add(self, name, lat, lon, kind="paikka"):
+        # Ensimmäinen lähde voittaa (LOCATIONS lisätään ensin)
+        if name.lower() in self.index:
+            return
+        self.places[name] = (lat, lon, kind)
+        self.index[name.lower()] = name
+        self._memo.clear()
+
+    def add_source(self, mapping, kind="paikka"):
+        for name, (lat, lon) in mapping.items():
+            self.add(name, lat, lon, kind)
+
+    def add_alias(self, alias, name):
+        if name in self.places:
+            self.aliases[alias.lower()] = name
+            self._memo.clear()
+
+    def _exact(self, key):
+        if key in self.index:
+            return self.index[key]
+        return self.aliases.get(key)
+
+    def resolve_name(self, name):
+        # Tarkka haku -> taivutuspäätteetön haku -> sumea haku
+        key = name.strip().lower()
+        if key in self._memo:
+            return self._memo[key]
+        found = self._exact(key)
+        if not found and self.normalize:
+            normalized = self.normalize(name).lower()
+            found = self._exact(normalized)
+            key_for_fuzzy = normalized
+        else:
+            key_for_fuzzy = key
+        if not found and key_for_fuzzy:
+            close = difflib.get_close_matches(key_for_fuzzy, list(self.index), n=1, cutoff=self.fuzzy_cutoff)
+            if close:
+                found = self.index[close[0]]
+        self._memo[key] = found
+        return found
+
+    def resolve(self, name):
+        found = self.resolve_name(name) if name else None
+        if not found:
+            return None
+        lat, lon, _ = self.places[found]
+        return lat, lon, found
+
+    def __len__(self):
+        return len(self.places)
+
+def add_geonames(gazetteer, filename):
+    # GeoNames-vedos (esim. FI.txt, CC BY 4.0): sarakkeet 1=nimi, 4=lat, 5=lon, 7=koodi
+    count = 0
+    with open(filename, 'r', encoding='utf-8') as f:
+        for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if len(row) < 8 or row[7] not in GEONAMES_KINDS:
+                continue
+            gazetteer.add(row[1], float(row[4]), float(row[5]), GEONAMES_KINDS[row[7]])
+            count += 1
+    return count
+
+def build(geonames_file=None):
+    # Kootaan nimistö olemassa olevista lähteistä: LOCATIONS, SYNONYMS-kohteet
+    # geokoodausvälimuistin koordinaateilla sekä ICAO-tunnukset aliaksina.
+    import data_enricher as de
+
+    gazetteer = Gazetteer(normalize=de.clean_finnish_location)
+    icao_targets = {name for key, name in de.SYNONYMS.items() if len(key) == 4 and key.startswith("ef")}
+    for name, (lat, lon) in de.LOCATIONS.items():
+        gazetteer.add(name, lat, lon, "lentopaikka" if name in icao_targets else "paikka")
+
+    cache = de.load_json(de.LOCATION_CACHE_FILE)
+    for target in sorted(set(de.SYNONYMS.values())):
+        clean_name = de.clean_finnish_location(target)
+        coords = cache.get(clean_name)
+        # Välimuistin typistetyt nimet (esim. "Helsinki-vanta") ratkeavat jo LOCATIONSista
+        if coords and not gazetteer.resolve_name(clean_name):
+            gazetteer.add(clean_name, coords[0], coords[1], "kunta")
+
+    if geonames_file:
+        print(f"GeoNames: {add_geonames(gazetteer, geonames_file)} paikkaa.")
+
+    for key, name in de.SYNONYMS.items():
+        if len(key) == 4 and key.startswith("ef"):
+            gazetteer.add_alias(key, name)
+    return gazetteer
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-paikannimistön rakentaminen")
+    parser.add_argument("--geonames", help="Valinnainen GeoNames-vedos (FI.txt)")
+    args = parser.parse_args()
+    gazetteer = build(args.geonames)
+    gazetteer.save()
+    print(f"Tallennettu {len(gazetteer)} paikkaa ja {len(gazetteer.aliases)} aliasta: {GAZETTEER_FILE}")
+
+if __name__ == "__main__":
+    main()
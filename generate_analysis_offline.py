@@ -1,8 +1,10 @@
 import json
 import google.generativeai as genai
-import time
 import os
-from google.api_core import exceptions
+import argparse
+import hashlib
+import asyncio
+from ai_client import AsyncGeminiClient
 
 # --- ASETUKSET ---
 try:
@@ -16,15 +18,30 @@ MODEL_NAME = 'gemini-2.5-flash'
 
 INPUT_FILE = "structured_data.json"
 OUTPUT_FILE = "ai_analyses.json"
+CHUNK_CACHE_FILE = "ai_chunk_cache.json"
 
-def create_analysis_prompt(ac_type, reports):
-    context = ""
-    
-    # Järjestetään aikajärjestykseen
-    reports_sorted = sorted(reports, key=lambda x: x.get('date', '9999'))
-    
-    for r in reports_sorted: 
-        context += f"- {r['date']} | {r['location_name']}: {r['summary'][:300]}\n"
+# Kasvata, kun create_analysis_prompt-pohjaa muutetaan (mitätöi välimuistin)
+PROMPT_VERSION = 2
+
+# Karkea arvio: noin 4 merkkiä per token
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def format_report_line(r):
+    # Rikastimen poimimat kentät: tarkka päivä ja luokka, jos ne ovat saatavilla
+    when = r.get('event_date') or r['date']
+    event_class = f" | {r['event_class']}" if r.get('event_class') else ""
+    return f"- {when} | {r['location_name']}{event_class}: {r['summary'][:300]}\n"
+
+def sort_reports(reports):
+    # Järjestetään aikajärjestykseen (tapahtumapäivä, muuten vuosi)
+    return sorted(reports, key=lambda x: x.get('event_date') or x.get('date', '9999'))
+
+def create_analysis_prompt(ac_type, reports, context=None, material="AINEISTO (Aikajärjestyksessä)"):
+    if context is None:
+        context = "".join(format_report_line(r) for r in sort_reports(reports))
 
     return f"""
     Toimit riippumattomana ilmailuturvallisuuden data-analyytikkona.
@@ -38,7 +55,7 @@ def create_analysis_prompt(ac_type, reports):
     KOHDERYHMÄ: {ac_type}
     TAPAUSTEN MÄÄRÄ: {len(reports)}
     
-    AINEISTO (Aikajärjestyksessä):
+    {material}:
     {context}
     
     LAADI ANALYYSI (Markdown-muodossa):
@@ -57,25 +74,157 @@ def create_analysis_prompt(ac_type, reports):
     Kirjoita suomeksi, selkeällä ja neutraalilla tyylillä.
     """
 
-def generate_with_backoff(model, prompt):
-    retries = 5
-    wait_time = 10 
+# --- MAP-REDUCE (suuret ryhmät, kuten Kaikki) ---
+def chunk_reports(reports, token_budget):
+    # Pakataan peräkkäisiä vuosia samaan osaan, kunnes tokenibudjetti täyttyy.
+    # Yksittäinen budjetin ylittävä vuosi pilkotaan useampaan osaan.
+    by_year = {}
+    for r in sort_reports(reports):
+        by_year.setdefault(r.get('date', 'N/A'), []).append(r)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for year, year_reports in by_year.items():
+        year_tokens = sum(estimate_tokens(format_report_line(r)) for r in year_reports)
+        if current and current_tokens + year_tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        for r in year_reports:
+            line_tokens = estimate_tokens(format_report_line(r))
+            if current and current_tokens + line_tokens > token_budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(r)
+            current_tokens += line_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_label(chunk):
+    first, last = chunk[0].get('date', 'N/A'), chunk[-1].get('date', 'N/A')
+    return first if first == last else f"{first}–{last}"
+
+def create_chunk_prompt(ac_type, label, reports):
+    context = "".join(format_report_line(r) for r in reports)
+    return f"""
+    Toimit riippumattomana ilmailuturvallisuuden data-analyytikkona.
+    Alla on osa laajemmasta aineistosta ({ac_type}), jakso {label}, {len(reports)} tapausta.
     
-    for attempt in range(retries):
-        try:
-            response = model.generate_content(prompt)
-            return response.text
-        except exceptions.ResourceExhausted:
-            print(f"    ⚠️ Kiintiö täynnä (Yritys {attempt+1}/{retries}). Odotetaan {wait_time}s...")
-            time.sleep(wait_time)
-            wait_time *= 2 
-        except Exception as e:
-            print(f"    ❌ Muu virhe: {e}")
-            return None
-            
-    return "Analyysi epäonnistui."
+    AINEISTO:
+    {context}
+    
+    Tiivistä jakson keskeiset havainnot enintään 150 sanalla: tyypilliset tapahtumat,
+    toistuvat riskitekijät ja mahdolliset muutokset jakson aikana.
+    Älä esiinny viranomaisena. Kirjoita suomeksi, neutraalilla tyylillä.
+    """
+
+def create_reduce_prompt(ac_type, reports, chunk_summaries):
+    context = "".join(f"[{label}]\n{text.strip()}\n\n" for label, text in chunk_summaries)
+    return create_analysis_prompt(ac_type, reports, context=context, material="AINEISTO (Jaksokohtaiset tiivistelmät aikajärjestyksessä)")
+
+def analysis_cache_key(ac_type, reports):
+    # Avain riippuu vain promptin syötteistä, ei raporttien järjestyksestä
+    payload = sorted(
+        json.dumps({k: r.get(k) for k in ("id", "date", "event_date", "event_class", "location_name", "summary")}, ensure_ascii=False, sort_keys=True)
+        for r in reports
+    )
+    raw = json.dumps([MODEL_NAME, PROMPT_VERSION, ac_type, payload], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def chunk_cache_key(ac_type, chunk):
+    return analysis_cache_key(f"{ac_type} / {chunk_label(chunk)}", chunk)
+
+def save_json_atomic(data, filename):
+    # Kirjoitetaan väliaikaistiedostoon ja vaihdetaan atomisesti, ettei keskeytys riko tiedostoa
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, filename)
+
+def load_json(filename):
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def response_tokens(prompt, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return {"prompt": usage.prompt_token_count, "output": usage.candidates_token_count}
+    return {"prompt": estimate_tokens(prompt), "output": estimate_tokens(response.text)}
+
+async def run_single(client, prompt):
+    response = await client.generate_response(prompt)
+    if response is None:
+        return None, {}
+    return response.text, {"single": response_tokens(prompt, response)}
+
+async def run_map_reduce(client, ac_type, reports, token_budget, chunk_cache):
+    chunks = chunk_reports(reports, token_budget)
+    map_stats = {"chunks": len(chunks), "cached": 0, "prompt": 0, "output": 0}
+
+    async def summarise(chunk):
+        label = chunk_label(chunk)
+        key = chunk_cache_key(ac_type, chunk)
+        if key in chunk_cache:
+            map_stats["cached"] += 1
+            return label, chunk_cache[key]
+        prompt = create_chunk_prompt(ac_type, label, chunk)
+        response = await client.generate_response(prompt)
+        if response is None:
+            return label, None
+        tokens = response_tokens(prompt, response)
+        map_stats["prompt"] += tokens["prompt"]
+        map_stats["output"] += tokens["output"]
+        chunk_cache[key] = response.text
+        save_json_atomic(chunk_cache, CHUNK_CACHE_FILE)
+        return label, response.text
+
+    summaries = await asyncio.gather(*(summarise(c) for c in chunks))
+    if any(text is None for _, text in summaries):
+        return None, {"map": map_stats}
+
+    prompt = create_reduce_prompt(ac_type, reports, summaries)
+    response = await client.generate_response(prompt)
+    if response is None:
+        return None, {"map": map_stats}
+    return response.text, {"map": map_stats, "reduce": response_tokens(prompt, response)}
+
+def format_tokens(tokens):
+    return ", ".join(f"{stage}: {t.get('prompt', 0)} + {t.get('output', 0)}" for stage, t in tokens.items())
+
+async def run_jobs(jobs, analyses):
+    # jobs: [(avain, kuvaus, välimuistiavain, korutiini)]. Jokainen valmistunut tulos tallennetaan heti.
+    async def run_one(key, label, cache_key, job):
+        return key, label, cache_key, await job
+
+    tasks = [asyncio.create_task(run_one(*job)) for job in jobs]
+    done = 0
+    for next_done in asyncio.as_completed(tasks):
+        key, label, cache_key, (result, tokens) = await next_done
+        done += 1
+        if result:
+            analyses[key] = {"text": result, "cache_key": cache_key, "tokens": tokens}
+            save_json_atomic(analyses, OUTPUT_FILE)
+            print(f"[{done}/{len(jobs)}] ✅ Valmis: {label} (tokenit {format_tokens(tokens)})")
+        else:
+            print(f"[{done}/{len(jobs)}] ❌ Analyysi epäonnistui: {label}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI-analyysien generointi")
+    parser.add_argument("--rpm", type=int, default=10,
+                        help="Mallikutsujen enimmäismäärä minuutissa")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Samanaikaisten mallikutsujen enimmäismäärä")
+    parser.add_argument("--token-budget", type=int, default=24000,
+                        help="Yhden promptin aineiston tokenibudjetti; ylittävät ryhmät ajetaan map-reducena")
+    parser.add_argument("--map-reduce", action="store_true",
+                        help="Aja Kaikki-yhteenveto aina map-reducena")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     genai.configure(api_key=GOOGLE_API_KEY)
     print(f"Alustetaan malli: {MODEL_NAME}...")
     
@@ -99,35 +248,56 @@ def main():
             grouped_data[ac] = []
         grouped_data[ac].append(entry)
 
-    analyses = {}
-    
-    print(f"Aloitetaan analyysi {len(grouped_data)} ryhmälle (Neutraali sävy).")
-
-    for i, (ac_type, reports) in enumerate(grouped_data.items()):
-        key = f"Suomi_{ac_type}"
-        
-        if len(reports) > 0:
-            print(f"[{i+1}/{len(grouped_data)}] Analysoidaan: {ac_type} ({len(reports)} tapausta)...")
-            
-            prompt = create_analysis_prompt(ac_type, reports)
-            result = generate_with_backoff(model, prompt)
-            
-            if result:
-                analyses[key] = result
-                print("    ✅ Valmis.")
-            
-            time.sleep(5) 
-
+    groups = [(f"Suomi_{ac_type}", ac_type, f"{ac_type} ({len(reports)} tapausta)", reports)
+              for ac_type, reports in grouped_data.items() if len(reports) > 0]
     # Kaikki-yhteenveto
-    print(f"\n[{len(grouped_data)+1}] Luodaan yhteenveto KAIKISTA...")
-    all_prompt = create_analysis_prompt("Kaikki Suomen onnettomuudet", data)
-    all_result = generate_with_backoff(model, all_prompt)
-    if all_result:
-        analyses["Suomi_Kaikki"] = all_result
-        print("    ✅ Yhteenveto valmis.")
-
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(analyses, f, ensure_ascii=False, indent=4)
+    groups.append(("Suomi_Kaikki", "Kaikki Suomen onnettomuudet", "Yhteenveto KAIKISTA", data))
+
+    # Aiemmat tulokset säilyvät, kunnes uusi versio valmistuu; poistuneet ryhmät karsitaan
+    group_keys = {key for key, _, _, _ in groups}
+    analyses = {k: v for k, v in load_json(OUTPUT_FILE).items() if k in group_keys}
+    chunk_cache = load_json(CHUNK_CACHE_FILE)
+
+    client = AsyncGeminiClient(model, requests_per_minute=args.rpm, max_concurrency=args.concurrency, retries=5)
+    jobs = []
+    # Nykyisen datan jaksotiivistelmien avaimet, myös valmiiksi analysoiduille ryhmille
+    chunk_keys = set()
+    for key, ac_type, label, reports in groups:
+        context_tokens = sum(estimate_tokens(format_report_line(r)) for r in reports)
+        map_reduce = context_tokens > args.token_budget or (args.map_reduce and key == "Suomi_Kaikki")
+        if map_reduce:
+            chunk_keys.update(chunk_cache_key(ac_type, c) for c in chunk_reports(reports, args.token_budget))
+            cache_key = analysis_cache_key(f"{ac_type} | map-reduce {args.token_budget}", reports)
+        else:
+            cache_key = analysis_cache_key(ac_type, reports)
+        stored = analyses.get(key)
+        if isinstance(stored, dict) and stored.get("cache_key") == cache_key:
+            continue
+        if map_reduce:
+            print(f"  {label}: ~{context_tokens} tokenia aineistoa, käytetään map-reducea.")
+            job = run_map_reduce(client, ac_type, reports, args.token_budget, chunk_cache)
+        else:
+            job = run_single(client, create_analysis_prompt(ac_type, reports))
+        jobs.append((key, label, cache_key, job))
+
+    # Muuttuneen tai poistuneen datan jaksotiivistelmät karsitaan kuten ryhmäanalyysit
+    stale_chunks = set(chunk_cache) - chunk_keys
+    if stale_chunks:
+        for key in stale_chunks:
+            del chunk_cache[key]
+        save_json_atomic(chunk_cache, CHUNK_CACHE_FILE)
+        print(f"Karsittiin {len(stale_chunks)} vanhentunutta jaksotiivistelmää.")
+
+    print(f"Välimuistista: {len(groups) - len(jobs)}/{len(groups)} ryhmää.")
+    if not jobs:
+        save_json_atomic(analyses, OUTPUT_FILE)
+        print("Kaikki analyysit ajan tasalla.")
+        return
+
+    print(f"Aloitetaan analyysi {len(jobs)} ryhmälle rinnakkain (Neutraali sävy, {args.rpm} kyselyä/min).")
+
+    asyncio.run(run_jobs(jobs, analyses))
+    save_json_atomic(analyses, OUTPUT_FILE)
 
     print(f"\nVALMIS! Analyysit tallennettu: {OUTPUT_FILE}")
 
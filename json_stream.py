@@ -0,0 +1,98 @@
+import json
+import os
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = " \t\r\n"
+
+# --- VIRTAAVA JSON-LUKU ---
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    # Jäsentää ylimmän tason taulukon alkio kerrallaan: muistissa on vain
+    # lukupuskuri ja yksi raportti, ei koko tiedostoa.
+    decoder = json.JSONDecoder()
+    buf, pos, eof, started = "", 0, False, False
+    while True:
+        while pos < len(buf) and (buf[pos] in WHITESPACE or (started and buf[pos] == ",")):
+            pos += 1
+        need_more = pos == len(buf)
+        if not need_more:
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Syöte ei ole JSON-taulukko")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                need_more = True
+            else:
+                # Puskurin lopussa päättyvä luku voi jatkua seuraavassa palassa
+                if eof or (end < len(buf) and buf[end] in WHITESPACE + ",]"):
+                    pos = end
+                    yield value
+                    continue
+                need_more = True
+        if need_more:
+            if eof:
+                raise ValueError("JSON-taulukko päättyi kesken")
+            # Isot alkiot: luetaan vähintään puskurin verran lisää, ettei kopiointi kasva neliöllisesti
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+def iter_json_records(filename, chunk_size=CHUNK_SIZE):
+    # Tukee sekä JSON-taulukkoa että JSON Lines -muotoa (yksi objekti per rivi)
+    with open(filename, 'r', encoding='utf-8') as f:
+        first = ""
+        while True:
+            first = f.read(1)
+            if not first or first not in WHITESPACE:
+                break
+        if not first:
+            return
+        f.seek(0)
+        if first == "[":
+            yield from iter_json_array(f, chunk_size)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+# --- VIRTAAVA JSON-KIRJOITUS ---
+class JsonArrayWriter:
+    # Kirjoittaa saman muodon kuin json.dump(records, indent=4) tietue kerrallaan.
+    # Valmis tiedosto vaihdetaan paikalleen vasta onnistuneen ajon lopussa.
+    def __init__(self, filename, indent=4):
+        self.filename = filename
+        self.tmp_file = filename + ".tmp"
+        self.indent = indent
+        self.count = 0
+        self.f = open(self.tmp_file, 'w', encoding='utf-8')
+        self.f.write("[")
+
+    def write(self, record):
+        text = json.dumps(record, ensure_ascii=False, indent=self.indent)
+        prefix = " " * self.indent
+        self.f.write(("," if self.count else "") + "\n" + prefix + text.replace("\n", "\n" + prefix))
+        self.count += 1
+
+    def close(self):
+        self.f.write("\n]" if self.count else "]")
+        self.f.close()
+        os.replace(self.tmp_file, self.filename)
+
+    def abort(self):
+        self.f.close()
+        os.remove(self.tmp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
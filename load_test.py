@@ -0,0 +1,126 @@
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from run_stats import RunStats
+
+DEFAULT_URL = "http://127.0.0.1:8502"
+
+# Dashboardin tyypilliset kyselyt; {type} korvataan datan konetyypeillä
+QUERY_TEMPLATES = [
+    "/counts",
+    "/types",
+    "/years?type={type}",
+    "/locations?type={type}",
+    "/incidents?type={type}",
+    "/incidents?type={type}&year>=2010",
+    "/incidents?year>=2000&year<2010&limit=100",
+    "/incidents?class=onnettomuus&offset=50",
+    "/analyses/{type}",
+]
+
+# --- KUORMITUSTESTI (vain localhost) ---
+def fetch(conn, path, etag=None):
+    headers = {"If-None-Match": etag} if etag else {}
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    return response.status, response.getheader("ETag"), body
+
+def build_paths(base):
+    split = urlsplit(base)
+    conn = http.client.HTTPConnection(split.hostname, split.port or 80, timeout=10)
+    status, _, body = fetch(conn, "/types")
+    conn.close()
+    if status != 200:
+        sys.exit(f"Rajapinta ei vastaa odotetusti ({status}): {base}")
+    types = list(json.loads(body)["types"])
+    paths = []
+    for template in QUERY_TEMPLATES:
+        if "{type}" in template:
+            paths.extend(template.format(type=quote(ac_type)) for ac_type in types)
+        else:
+            paths.append(template)
+    return paths
+
+def worker(base, paths, count, offset, revalidate, stats, lock):
+    split = urlsplit(base)
+    conn = http.client.HTTPConnection(split.hostname, split.port or 80, timeout=10)
+    etags = {}
+    latencies = []
+    statuses = {}
+    for i in range(count):
+        path = paths[(offset + i) % len(paths)]
+        start = time.perf_counter()
+        status, etag, _ = fetch(conn, path, etags.get(path) if revalidate else None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+        if etag:
+            etags[path] = etag
+    conn.close()
+    with lock:
+        for value in latencies:
+            stats.sample("latency_ms", value)
+        for status, n in statuses.items():
+            stats.incr(f"status_{status}", n)
+
+def run(base, requests, concurrency, revalidate):
+    paths = build_paths(base)
+    stats = RunStats()
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+    threads = [threading.Thread(target=worker, args=(base, paths, per_thread, n * 7, revalidate, stats, lock))
+               for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = per_thread * concurrency
+    return {
+        "url": base,
+        "paths": len(paths),
+        "requests": total,
+        "concurrency": concurrency,
+        "revalidate": revalidate,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1) if elapsed else None,
+        "statuses": stats.counters,
+        "latency_ms": RunStats.percentiles(stats.samples.get("latency_ms", [])),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Kyselyrajapinnan (query_api.py) kuormitustesti")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Rajapinnan osoite")
+    parser.add_argument("--requests", type=int, default=5000, help="Pyyntöjen kokonaismäärä")
+    parser.add_argument("--concurrency", type=int, default=8, help="Samanaikaiset yhteydet")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Lähetä If-None-Match edellisellä ETagilla (304-vastaukset)")
+    parser.add_argument("--budget-ms", type=float, default=10.0,
+                        help="Tavoiteviive; p99:n ylitys palauttaa virhekoodin")
+    parser.add_argument("--output", help="Tallenna tulokset JSON-tiedostoon")
+    args = parser.parse_args()
+
+    if urlsplit(args.url).hostname not in ("127.0.0.1", "localhost", "::1"):
+        sys.exit("Kuormitustesti ajetaan vain paikallista palvelinta vastaan.")
+
+    result = run(args.url, args.requests, args.concurrency, args.revalidate)
+    latency = result["latency_ms"]
+    print(f"{result['requests']} pyyntöä ({result['paths']} eri kyselyä, {args.concurrency} yhteyttä) "
+          f"{result['seconds']:.2f} s:ssa: {result['requests_per_second']} pyyntöä/s")
+    print(f"Viive ms: p50 {latency.get('p50')}, p90 {latency.get('p90')}, p99 {latency.get('p99')}, max {latency.get('max')}")
+    print(f"Vastaukset: {result['statuses']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+    if latency.get("p99", 0) > args.budget_ms:
+        print(f"p99 ylittää tavoitteen {args.budget_ms} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import html
+import numpy as np
+import pandas as pd
+
+# --- KARTTAKERROS: palvelimella klusteroidut pisteet ---
+MIN_ZOOM = 4
+MAX_ZOOM = 12
+POPUP_ITEMS = 5
+
+def clamp_zoom(zoom):
+    return max(MIN_ZOOM, min(MAX_ZOOM, int(round(zoom))))
+
+def cell_size(zoom):
+    # Ruudukon solu asteina: zoom 5 -> 2°, zoom 8 -> 0.25°, zoom 12 -> ~0.016°
+    return 64.0 / (2 ** clamp_zoom(zoom))
+
+def cluster_features(view, zoom):
+    # Kootaan pisteet zoom-tason ruudukkoon ja palautetaan kompakti GeoJSON
+    points = view.dropna(subset=['lat', 'lon'])
+    collection = {"type": "FeatureCollection", "features": []}
+    if points.empty:
+        return collection
+
+    size = cell_size(zoom)
+    cells = pd.DataFrame({
+        "cx": np.floor(points['lon'].to_numpy(dtype=float) / size).astype(np.int32),
+        "cy": np.floor(points['lat'].to_numpy(dtype=float) / size).astype(np.int32),
+        "lat": points['lat'].to_numpy(dtype=float),
+        "lon": points['lon'].to_numpy(dtype=float),
+        "accident": points['is_accident'].to_numpy(dtype=bool),
+        "id": points['id'].to_numpy(),
+        "date": points['date'].to_numpy(),
+        "aircraft_type": points['aircraft_type'].astype(str).to_numpy(),
+        "location_name": points['location_name'].astype(str).to_numpy(),
+    })
+    grouped = cells.groupby(["cx", "cy"], sort=False)
+    summary = grouped.agg(
+        count=("id", "size"),
+        lat=("lat", "mean"),
+        lon=("lon", "mean"),
+        accidents=("accident", "sum"),
+    )
+    first_rows = grouped.head(POPUP_ITEMS)
+    members = first_rows.groupby(["cx", "cy"], sort=False)
+
+    for key, rows in members:
+        s = summary.loc[key]
+        count = int(s["count"])
+        first = rows.iloc[0]
+        if count == 1:
+            label = f"{first['aircraft_type']} - {first['location_name']}"
+            popup = f"<b>{html.escape(first['id'])}</b><br>{html.escape(str(first['date']))}"
+        else:
+            top_location = rows['location_name'].mode().iat[0]
+            label = f"{count} tapausta - {top_location}"
+            lines = "<br>".join(f"{html.escape(str(r['date']))} | {html.escape(r['id'])}" for _, r in rows.iterrows())
+            more = f"<br>… ja {count - len(rows)} muuta" if count > len(rows) else ""
+            popup = f"<b>{count} tapausta</b><br>{lines}{more}"
+        # Punainen, jos valtaosa solun tapauksista on onnettomuuksia
+        color = "red" if s["accidents"] * 2 > count else "blue"
+        collection["features"].append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(float(s["lon"]), 5), round(float(s["lat"]), 5)]},
+            "properties": {
+                "count": count,
+                "label": label,
+                "popup": popup,
+                "color": color,
+                "radius": round(6 + 4 * float(np.log2(count)), 1),
+            },
+        })
+    return collection
+
+def heat_points(spatial, view, zoom):
+    # Tiheysruudukko zoom-tason mukaan: [[lat, lon, paino]] HeatMap-tasolle
+    cell = cell_size(zoom) / 4
+    lat, lon, counts = spatial.density(view['row'].to_numpy(), cell)
+    weights = counts / counts.max() if len(counts) else counts
+    return [[round(float(a), 4), round(float(b), 4), round(float(w), 3)] for a, b, w in zip(lat, lon, weights)]
+
+def build_map(collection, center, zoom, heat=None, area=None):
+    # heat: heat_points-lista; area: (lat, lon, säde km) piirretään ympyränä
+    import folium
+
+    m = folium.Map(location=center, zoom_start=zoom)
+    if heat:
+        from folium.plugins import HeatMap
+        HeatMap(heat, radius=18, blur=14, min_opacity=0.3, name="Lämpökartta").add_to(m)
+    if area:
+        folium.Circle(location=[area[0], area[1]], radius=area[2] * 1000, color="#0f5499",
+                      weight=2, fill=False).add_to(m)
+    if collection["features"]:
+        folium.GeoJson(
+            collection,
+            marker=folium.CircleMarker(fill=True, fill_opacity=0.7, weight=1),
+            style_function=lambda f: {
+                "radius": f["properties"]["radius"],
+                "color": f["properties"]["color"],
+                "fillColor": f["properties"]["color"],
+            },
+            tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False),
+            popup=folium.GeoJsonPopup(fields=["popup"], labels=False, max_width=300),
+        ).add_to(m)
+    return m
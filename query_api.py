@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus, urlsplit
+
+# Projektin secrets.py (API-avain) peittää stdlibin secrets-moduulin, jota pandas
+# (numpy.random) tarvitsee. Stdlibin moduuli haetaan ensin ilman projektin hakemistoa.
+_project_dir = os.path.dirname(os.path.abspath(__file__))
+_saved_path = sys.path[:]
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != _project_dir]
+try:
+    import secrets  # noqa: F401
+finally:
+    sys.path[:] = _saved_path
+
+import numpy as np
+
+from dashboard_data import (DashboardData, data_version, load_frame, load_analyses, load_search_index,
+                            LIST_COLUMNS, DETAIL_COLUMNS, ANALYSES_FILE, SEARCH_INDEX_FILE)
+
+# --- ASETUKSET ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+RESPONSE_CACHE_SIZE = 1024
+
+# Kenttä, operaattori ja arvo, esim. year>=2010, type=Cessna
+CONDITION_RE = re.compile(r"^(\w+)(>=|<=|!=|=|>|<)(.*)$")
+YEAR_OPS = {
+    "=": np.equal, "!=": np.not_equal, ">=": np.greater_equal,
+    "<=": np.less_equal, ">": np.greater, "<": np.less,
+}
+# Suodatettavat tekstikentät: kyselyn nimi -> sarake
+TEXT_FILTERS = {"type": "aircraft_type", "location": "location_name", "class": "event_class"}
+RECORD_COLUMNS = ["id", "date", "event_date", "aircraft_type", "location_name", "lat", "lon",
+                  "event_class", "registrations", "url", "summary"]
+
+class QueryError(ValueError):
+    pass
+
+def parse_query(query):
+    # urllib.parse.parse_qsl ei tunne vertailuja (year>=2010), joten pilkotaan itse.
+    # Palautetaan järjestetty tuple, jotta samat ehdot osuvat samaan välimuistiavaimeen.
+    conditions = []
+    for part in query.split("&"):
+        if not part:
+            continue
+        m = CONDITION_RE.match(unquote_plus(part))
+        if not m:
+            raise QueryError(f"Virheellinen ehto: {unquote_plus(part)}")
+        conditions.append(m.groups())
+    return tuple(sorted(conditions))
+
+def versions():
+    return (data_version(), data_version(SEARCH_INDEX_FILE), data_version(ANALYSES_FILE))
+
+def make_etag(version_tuple):
+    return '"' + hashlib.sha1("|".join(version_tuple).encode('utf-8')).hexdigest()[:20] + '"'
+
+def to_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+# --- ESILASKETTU KYSELYDATA ---
+class QueryData:
+    # Yksi datatiedoston versio muistissa: rivit valmiiksi JSON-muodossa, sarakkeet
+    # numpy-taulukkoina suodatusta varten ja vastaukset välimuistissa versiokohtaisesti.
+    def __init__(self, data, analyses, search, version_tuple):
+        self.data = data
+        self.analyses = analyses
+        self.search = search
+        self.versions = version_tuple
+        self.etag = make_etag(version_tuple)
+
+        df = data.df
+        self.records = []
+        self.columns = {name: np.array([], dtype=str) for name in TEXT_FILTERS}
+        self.years = np.zeros(0, dtype='int16')
+        if not df.empty:
+            columns = [c for c in RECORD_COLUMNS if c in df.columns]
+            frame = df[columns].astype(object)
+            self.records = frame.where(frame.notna(), None).to_dict('records')
+            for record in self.records:
+                # Arrow-listasarakkeet tulevat numpy-taulukkoina
+                if isinstance(record.get("registrations"), np.ndarray):
+                    record["registrations"] = record["registrations"].tolist()
+            self.columns = {name: df[column].astype(str).to_numpy() for name, column in TEXT_FILTERS.items()}
+            self.years = df['year'].to_numpy()
+        self.positions = {record["id"]: i for i, record in enumerate(self.records)}
+
+        # Suodattamattomat koosteet lasketaan kerran latauksessa
+        self.aggregates = {ac: self._aggregate(self._type_positions(ac)) for ac in data.aircraft_types}
+        self.respond = lru_cache(maxsize=RESPONSE_CACHE_SIZE)(self._respond)
+
+    @classmethod
+    def load(cls):
+        version_tuple = versions()
+        data = DashboardData(load_frame(LIST_COLUMNS + DETAIL_COLUMNS))
+        return cls(data, load_analyses(), load_search_index(), version_tuple)
+
+    def _type_positions(self, ac_type):
+        if ac_type == "Kaikki":
+            return np.arange(len(self.records))
+        return np.asarray(self.data.group_indices.get(ac_type, []), dtype=np.int64)
+
+    def _aggregate(self, positions):
+        types, type_counts = np.unique(self.columns["type"][positions], return_counts=True)
+        locations, loc_counts = np.unique(self.columns["location"][positions], return_counts=True)
+        years, year_counts = np.unique(self.years[positions], return_counts=True)
+        by_location = sorted(zip(locations, loc_counts), key=lambda x: (-x[1], x[0]))
+        return {
+            "count": int(len(positions)),
+            "types": {str(k): int(v) for k, v in zip(types, type_counts)},
+            "locations": {str(k): int(v) for k, v in by_location},
+            # Vuosi 0 = tuntematon (N/A)
+            "years": {str(int(k)) if k else "N/A": int(v) for k, v in zip(years, year_counts)},
+        }
+
+    def select(self, conditions):
+        # Palauttaa (rivinumerot, hakupisteet) ehtojen mukaan; oletusjärjestys uusin ensin
+        ac_type = "Kaikki"
+        scores = None
+        for field, op, value in conditions:
+            if field == "type" and op == "=":
+                ac_type = value
+        positions = self._type_positions(ac_type)
+        for field, op, value in conditions:
+            if (field == "type" and op == "=") or field in ("limit", "offset"):
+                continue
+            if field == "year":
+                if op not in YEAR_OPS:
+                    raise QueryError(f"Tuntematon vertailu: year{op}")
+                try:
+                    year = int(value)
+                except ValueError:
+                    raise QueryError(f"Vuoden pitää olla kokonaisluku: {value}")
+                positions = positions[YEAR_OPS[op](self.years[positions], year)]
+            elif field in TEXT_FILTERS:
+                if op not in ("=", "!="):
+                    raise QueryError(f"Kentälle {field} sallitaan vain = ja !=")
+                matches = self.columns[field][positions] == value
+                positions = positions[matches if op == "=" else ~matches]
+            elif field == "q" and op == "=":
+                if self.search is None:
+                    raise QueryError("Hakuindeksiä ei ole (aja data_enricher.py)")
+                hits = self.search.search(value)
+                scores = {self.positions[doc_id]: score for doc_id, score in hits if doc_id in self.positions}
+                positions = positions[np.isin(positions, list(scores))]
+                # Osuvuusjärjestys; vakaa lajittelu säilyttää oletusjärjestyksen tasapisteissä
+                positions = np.array(sorted(positions, key=lambda p: -scores[p]), dtype=np.int64)
+            else:
+                raise QueryError(f"Tuntematon ehto: {field}{op}")
+        return positions, scores
+
+    def _incidents(self, conditions):
+        options = {field: value for field, op, value in conditions if field in ("limit", "offset")}
+        try:
+            limit = min(MAX_LIMIT, int(options.get("limit", DEFAULT_LIMIT)))
+            offset = max(0, int(options.get("offset", 0)))
+        except ValueError:
+            raise QueryError("limit ja offset ovat kokonaislukuja")
+        positions, scores = self.select(conditions)
+        items = []
+        for p in positions[offset:offset + limit]:
+            record = self.records[p]
+            if scores is not None:
+                record = {**record, "score": round(scores[p], 4)}
+            items.append(record)
+        return {"total": int(len(positions)), "offset": offset, "limit": limit, "items": items}
+
+    def _aggregates(self, conditions):
+        ac_types = [value for field, op, value in conditions if field == "type" and op == "="]
+        if len(conditions) == len(ac_types) and len(ac_types) <= 1:
+            aggregate = self.aggregates.get(ac_types[0] if ac_types else "Kaikki")
+            if aggregate is not None:
+                return aggregate
+        return self._aggregate(self.select(conditions)[0])
+
+    def _respond(self, path, conditions):
+        # Palauttaa (HTTP-tila, JSON-tavut)
+        parts = [unquote_plus(p) for p in path.strip("/").split("/") if p]
+        try:
+            if parts == ["incidents"]:
+                return 200, to_json(self._incidents(conditions))
+            if len(parts) == 2 and parts[0] == "incidents" and not conditions:
+                position = self.positions.get(parts[1])
+                if position is None:
+                    return 404, to_json({"error": f"Raporttia ei löydy: {parts[1]}"})
+                return 200, to_json(self.records[position])
+            if len(parts) == 1 and parts[0] in ("counts", "types", "locations", "years"):
+                aggregate = self._aggregates(conditions)
+                if parts[0] == "counts":
+                    return 200, to_json(aggregate)
+                return 200, to_json({"count": aggregate["count"], parts[0]: aggregate[parts[0]]})
+            if parts == ["analyses"] and not conditions:
+                return 200, to_json(self.analyses)
+            if len(parts) == 2 and parts[0] == "analyses" and not conditions:
+                # Sama avain kuin dashboardissa: Suomi_<tyyppi>
+                key = parts[1] if parts[1] in self.analyses else f"Suomi_{parts[1]}"
+                if key not in self.analyses:
+                    return 404, to_json({"error": f"Analyysia ei löydy: {parts[1]}"})
+                return 200, to_json({"key": key, "text": self.analyses[key]})
+            if parts == ["version"] and not conditions:
+                return 200, to_json({"etag": self.etag, "versions": list(self.versions), "reports": len(self.records)})
+        except QueryError as e:
+            return 400, to_json({"error": str(e)})
+        return 404, to_json({"error": f"Tuntematon polku: {path}"})
+
+# --- HTTP-PALVELIN ---
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, verbose=False):
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self.query_data = QueryData.load()
+        super().__init__(address, QueryHandler)
+
+    def current(self):
+        # Ladataan uudelleen, kun rikastin tai analyysiskripti on kirjoittanut tiedostot
+        if versions() != self.query_data.versions:
+            with self._lock:
+                if versions() != self.query_data.versions:
+                    self.query_data = QueryData.load()
+                    print(f"Data ladattu uudelleen: {len(self.query_data.records)} raporttia")
+        return self.query_data
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server_version = "OtkesQueryAPI/1.0"
+    # Keep-alive: kuormitustesti ja muut asiakkaat käyttävät samaa yhteyttä. Otsakkeet ja
+    # runko kirjoitetaan erikseen, joten Nagle + viivästetty ACK lisäisi ~40 ms vastaukseen.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        query_data = self.server.current()
+        url = urlsplit(self.path)
+        if query_data.etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", query_data.etag)
+            self.end_headers()
+            return
+        try:
+            status, body = query_data.respond(url.path, parse_query(url.query))
+        except QueryError as e:
+            status, body = 400, to_json({"error": str(e)})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", query_data.etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Vain luku -kyselyrajapinta rikastettuun dataan")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--verbose", action="store_true", help="Tulosta jokainen pyyntö")
+    args = parser.parse_args()
+
+    server = QueryServer((args.host, args.port), verbose=args.verbose)
+    print(f"Kyselyrajapinta: http://{args.host}:{args.port}/ ({len(server.query_data.records)} raporttia)")
+    print("Esim. /incidents?type=Cessna&year>=2010, /counts, /locations?type=Helikopteri, /analyses/Cessna")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
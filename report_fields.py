@@ -0,0 +1,77 @@
+import datetime
+import re
+
+# Kasvata, kun poiminnan sääntöjä muutetaan (mitätöi rikastimen manifestin)
+FIELDS_VERSION = 1
+
+EVENT_CLASSES = ["onnettomuus", "vakava vaaratilanne", "vaaratilanne", "muu"]
+
+# Yksi käännetty alternaatio: päivämäärä, OH-rekisteritunnus ja tapahtumaluokan avainsanat
+# löytyvät samalla läpikäynnillä. Tunnukset ovat isoilla kirjaimilla, avainsanat mitä tahansa.
+FIELD_PATTERN = re.compile(
+    r"(?P<date>(?<![\d.])(?P<day>\d{1,2})\.(?P<month>\d{1,2})\.(?P<year>(?:19|20)\d{2})(?!\d))"
+    r"|(?P<reg>\bOH-(?:[A-Z]{3}|U?\d{3,4}|[A-Z]\d{2,3})\b)"
+    r"|(?P<serious>(?i:vakava(?:n|ssa)? vaaratilan))"
+    r"|(?P<accident>(?i:onnettomuu))"
+    r"|(?P<incident>(?i:vaaratila|vaarantanut|vaarantava))"
+)
+REPORT_CLASS_PATTERN = re.compile(r"^([A-Z])(?:\d|\d{3}[- ])")
+
+# Päivämäärä haetaan tekstistä vain alusta, jos otsikossa ei ole sitä
+TEXT_DATE_WINDOW = 1000
+
+def _date(m):
+    try:
+        return datetime.date(int(m.group("year")), int(m.group("month")), int(m.group("day"))).isoformat()
+    except ValueError:
+        return None
+
+def scan(text):
+    # Palauttaa (ensimmäinen päivämäärä, sen kohta, tunnukset, löydetyt luokat)
+    first_date, date_pos = None, None
+    registrations = []
+    classes = set()
+    for m in FIELD_PATTERN.finditer(text or ""):
+        kind = m.lastgroup
+        if kind == "date":
+            if first_date is None:
+                first_date, date_pos = _date(m), m.start()
+        elif kind == "reg":
+            if m.group("reg") not in registrations:
+                registrations.append(m.group("reg"))
+        else:
+            classes.add(kind)
+    return first_date, date_pos, registrations, classes
+
+def event_class(classes):
+    if "accident" in classes:
+        return "onnettomuus"
+    if "serious" in classes:
+        return "vakava vaaratilanne"
+    if "incident" in classes:
+        return "vaaratilanne"
+    return "muu"
+
+def event_class_from_title(title):
+    return event_class(scan(title)[3])
+
+def report_class(report_id):
+    # Raporttisarjan kirjain (esim. B11996L -> B, L2012-09 -> L)
+    m = REPORT_CLASS_PATTERN.match(report_id or "")
+    return m.group(1) if m else None
+
+def extract_fields(title, text):
+    title_date, _, registrations, classes = scan(title)
+    text_date, text_date_pos, text_registrations, _ = scan(text)
+    for reg in text_registrations:
+        if reg not in registrations:
+            registrations.append(reg)
+    # Tekstin päivämäärä kelpaa vain aivan alusta (myöhemmin tulee julkaisupäiviä yms.)
+    if text_date_pos is not None and text_date_pos >= TEXT_DATE_WINDOW:
+        text_date = None
+    return {
+        "event_date": title_date or text_date,
+        "registrations": registrations,
+        "report_class": report_class(title),
+        "event_class": event_class(classes),
+    }
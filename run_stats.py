@@ -0,0 +1,67 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# --- AJON MITTARIT ---
+class RunStats:
+    # Vaiheiden seinäkelloajat, laskurit ja viivenäytteet yhdestä ajosta.
+    # Kaikki arvot ovat tavallisia sanakirjoja, jotta poolin työprosessien
+    # mittaukset voidaan palauttaa ja yhdistää koordinaattorissa.
+    def __init__(self, max_samples=None):
+        # max_samples: pitkäikäisessä prosessissa säilytetään vain uusimmat näytteet
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.timings = {}
+        self.counters = {}
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def incr(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def sample(self, name, value):
+        values = self.samples.get(name)
+        if values is None:
+            values = self.samples[name] = deque(maxlen=self.max_samples)
+        values.append(value)
+
+    def merge_timings(self, timings):
+        for name, seconds in timings.items():
+            self.add_time(name, seconds)
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+        def pick(q):
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return {
+            "count": len(ordered),
+            "p50": round(pick(0.50), 4),
+            "p90": round(pick(0.90), 4),
+            "p99": round(pick(0.99), 4),
+            "max": round(ordered[-1], 4),
+        }
+
+    def summary(self):
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(time.time() - self.started, 3),
+            "stages": {name: round(seconds, 4) for name, seconds in sorted(self.timings.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "latency": {name: self.percentiles(values) for name, values in sorted(self.samples.items())},
+        }
@@ -0,0 +1,130 @@
+import gzip
+import json
+import math
+import os
+import re
+from collections import Counter
+from itertools import accumulate
+
+SEARCH_INDEX_FILE = "search_index.json.gz"
+INDEX_VERSION = 1
+
+# Rekisteritunnukset (OH-PJX, D-EABC) pidetään kokonaisina, muut sanat pilkotaan
+TOKEN_RE = re.compile(r"(?<![\w-])[a-z]{1,2}-[a-z0-9]{3,5}(?![\w-])|\w+")
+
+STOPWORDS = {
+    "ja", "on", "oli", "ei", "se", "että", "tai", "kun", "niin", "mutta", "myös", "sen", "ovat", "olivat",
+    "hän", "joka", "jonka", "jossa", "joita", "jotka", "tämä", "tämän", "siitä", "sekä", "eikä", "mukaan",
+    "the", "and", "of",
+}
+
+# Sijapäätteet ja monikon merkit pisin ensin (kevyt vartalointi, ei täyttä morfologiaa)
+STEM_ENDINGS = sorted([
+    "issa", "issä", "illa", "illä", "ista", "istä", "ilta", "iltä", "ille", "iksi", "iden", "itten", "ien",
+    "seen", "ssa", "ssä", "sta", "stä", "lla", "llä", "lta", "ltä", "lle", "ksi", "tta", "ttä",
+    "ina", "inä", "ita", "itä", "na", "nä", "ta", "tä", "t", "n", "a", "ä",
+], key=len, reverse=True)
+VOWELS = "aeiouyäö"
+
+def fold(word):
+    # Taivutetut muodot samaan avaimeen: jäätäminen, jäätämisen, jäätämistä -> jäätäm
+    if any(c.isdigit() for c in word) or "-" in word:
+        return word
+    if word.endswith("nen") and len(word) > 5:
+        word = word[:-3] + "s"
+    for ending in STEM_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            word = word[:-len(ending)]
+            break
+    if word.endswith("se") and len(word) > 5:
+        word = word[:-2]
+    elif word.endswith("s") and len(word) > 4:
+        word = word[:-1]
+    while len(word) > 3 and word[-1] in VOWELS:
+        word = word[:-1]
+    return word
+
+def tokenize(text):
+    text = (text or "").lower().replace('\xad', '')
+    for token in TOKEN_RE.findall(text):
+        if len(token) < 2 or token in STOPWORDS or token.startswith("_"):
+            continue
+        yield fold(token)
+
+def term_counts(text):
+    return dict(Counter(tokenize(text)))
+
+# --- INDEKSIN RAKENNUS (rikastin) ---
+class SearchIndexBuilder:
+    def __init__(self):
+        self.ids = []
+        self.lengths = []
+        self.postings = {}
+
+    def add(self, doc_id, terms):
+        doc = len(self.ids)
+        self.ids.append(doc_id)
+        self.lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            docs, tfs = self.postings.setdefault(term, ([], []))
+            docs.append(doc)
+            tfs.append(tf)
+
+    def save(self, filename=SEARCH_INDEX_FILE):
+        # Dokumenttinumerot delta-koodattuina ja koko tiedosto gzip-pakattuna
+        terms = {}
+        for term, (docs, tfs) in self.postings.items():
+            deltas = [docs[0]] + [b - a for a, b in zip(docs, docs[1:])]
+            terms[term] = [deltas, tfs]
+        data = {"version": INDEX_VERSION, "ids": self.ids, "lengths": self.lengths, "terms": terms}
+        tmp_file = filename + ".tmp"
+        with gzip.open(tmp_file, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, filename)
+
+# --- HAKU (dashboard) ---
+class SearchIndex:
+    def __init__(self, ids, lengths, terms, k1=1.2, b=0.75):
+        self.ids = ids
+        self.lengths = lengths
+        self.terms = terms
+        self.k1 = k1
+        self.b = b
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self._decoded = {}
+
+    @classmethod
+    def load(cls, filename=SEARCH_INDEX_FILE):
+        with gzip.open(filename, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Hakuindeksin versio {data.get('version')} ei ole tuettu")
+        return cls(data["ids"], data["lengths"], data["terms"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def postings(self, term):
+        # Puretaan termin lista vasta ensimmäisellä haulla
+        if term not in self._decoded:
+            encoded = self.terms.get(term)
+            self._decoded[term] = dict(zip(accumulate(encoded[0]), encoded[1])) if encoded else {}
+        return self._decoded[term]
+
+    def search(self, query):
+        # Kaikkien hakusanojen on löydyttävä; järjestys BM25-pisteillä
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        lists = [self.postings(term) for term in terms]
+        candidates = set.intersection(*(set(p) for p in lists)) if all(lists) else set()
+        n = len(self.ids)
+        scores = {}
+        for postings in lists:
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc in candidates:
+                tf = postings[doc]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / (self.avg_length or 1))
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return [(self.ids[doc], score) for doc, score in ranked]
@@ -0,0 +1,167 @@
+import os
+import numpy as np
+
+SPATIAL_INDEX_FILE = "spatial_index.npz"
+INDEX_VERSION = 1
+EARTH_RADIUS_KM = 6371.0088
+# Ruudukon solu asteina (~28 km pohjois-eteläsuunnassa)
+CELL_DEG = 0.25
+# Solun x-koordinaatin kerroin avaimessa: avain = cy * CELL_STRIDE + cx
+CELL_STRIDE = 1 << 16
+# Lähimmän lentopaikan etäisyysmatriisi lasketaan näin monen pisteen erissä
+NEAREST_CHUNK = 4096
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Isoympyräetäisyys; toimii skalaareilla ja numpy-taulukoilla (broadcast)
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def cell_coords(lat, lon, cell_deg=CELL_DEG):
+    cy = np.floor((np.asarray(lat, dtype=float) + 90.0) / cell_deg).astype(np.int64)
+    cx = np.floor((np.asarray(lon, dtype=float) + 180.0) / cell_deg).astype(np.int64)
+    return cy, cx
+
+def nearest_airfields(lat, lon, airfield_lat, airfield_lon):
+    # Jokaiselle pisteelle lähimmän lentopaikan indeksi ja etäisyys (km)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    nearest = np.zeros(len(lat), dtype=np.int32)
+    distance = np.zeros(len(lat), dtype=float)
+    if not len(airfield_lat):
+        return nearest, np.full(len(lat), np.nan)
+    for start in range(0, len(lat), NEAREST_CHUNK):
+        chunk = slice(start, start + NEAREST_CHUNK)
+        d = haversine_km(lat[chunk, None], lon[chunk, None], airfield_lat[None, :], airfield_lon[None, :])
+        nearest[chunk] = d.argmin(axis=1)
+        distance[chunk] = d[np.arange(d.shape[0]), nearest[chunk]]
+    return nearest, distance
+
+# --- INDEKSIN RAKENNUS (rikastin) ---
+class SpatialIndexBuilder:
+    def __init__(self):
+        self.lat = []
+        self.lon = []
+
+    def add(self, lat, lon):
+        # Kutsutaan jokaiselle tulostiedoston riville samassa järjestyksessä (rivinumero = indeksi)
+        self.lat.append(np.nan if lat is None else lat)
+        self.lon.append(np.nan if lon is None else lon)
+
+    def save(self, airfields, filename=SPATIAL_INDEX_FILE):
+        # airfields: {nimi: (lat, lon)}, esim. data_enricher.LOCATIONS
+        lat = np.asarray(self.lat, dtype=float)
+        lon = np.asarray(self.lon, dtype=float)
+        rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        cy, cx = cell_coords(lat[rows], lon[rows])
+        keys = cy * CELL_STRIDE + cx
+        # Pisteet soluavaimen mukaan järjestykseen: yhden leveysvyön solut ovat peräkkäin
+        order = np.argsort(keys, kind='stable')
+        rows, keys = rows[order], keys[order]
+
+        names = list(airfields)
+        airfield_lat = np.array([airfields[n][0] for n in names], dtype=float)
+        airfield_lon = np.array([airfields[n][1] for n in names], dtype=float)
+        nearest, distance = nearest_airfields(lat[rows], lon[rows], airfield_lat, airfield_lon)
+
+        tmp_file = filename + ".tmp.npz"
+        np.savez_compressed(
+            tmp_file,
+            version=np.array(INDEX_VERSION),
+            cell_deg=np.array(CELL_DEG),
+            count=np.array(len(lat)),
+            rows=rows.astype(np.int32),
+            keys=keys,
+            lat=lat[rows],
+            lon=lon[rows],
+            nearest=nearest,
+            nearest_km=distance,
+            airfield_names=np.array(names, dtype=str),
+            airfield_lat=airfield_lat,
+            airfield_lon=airfield_lon,
+        )
+        os.replace(tmp_file, filename)
+
+# --- KYSELYT (dashboard) ---
+class SpatialIndex:
+    def __init__(self, arrays):
+        self.cell_deg = float(arrays["cell_deg"])
+        self.count = int(arrays["count"])
+        self.rows = arrays["rows"]
+        self.keys = arrays["keys"]
+        self.lat = arrays["lat"]
+        self.lon = arrays["lon"]
+        self.nearest = arrays["nearest"]
+        self.nearest_km = arrays["nearest_km"]
+        self.airfield_names = [str(n) for n in arrays["airfield_names"]]
+        self.airfield_lat = arrays["airfield_lat"]
+        self.airfield_lon = arrays["airfield_lon"]
+        self.airfield_index = {name: i for i, name in enumerate(self.airfield_names)}
+
+    @classmethod
+    def load(cls, filename=SPATIAL_INDEX_FILE):
+        with np.load(filename, allow_pickle=False) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                raise ValueError(f"Sijainti-indeksin versio {int(data['version'])} ei ole tuettu")
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.rows)
+
+    def airfield(self, name):
+        i = self.airfield_index[name]
+        return float(self.airfield_lat[i]), float(self.airfield_lon[i])
+
+    def _candidates(self, lat, lon, radius_km):
+        # Rajaavan laatikon solut: jokainen leveysvyö on yksi yhtenäinen avainväli
+        dlat = radius_km / 111.0
+        dlon = radius_km / (111.0 * max(np.cos(np.radians(min(abs(lat) + dlat, 89.0))), 0.01))
+        cy0, cx0 = cell_coords(lat - dlat, lon - dlon, self.cell_deg)
+        cy1, cx1 = cell_coords(lat + dlat, lon + dlon, self.cell_deg)
+        bands = np.arange(cy0, cy1 + 1) * CELL_STRIDE
+        starts = np.searchsorted(self.keys, bands + cx0, side='left')
+        ends = np.searchsorted(self.keys, bands + cx1, side='right')
+        if not len(starts) or not (ends > starts).any():
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s])
+
+    def within(self, lat, lon, radius_km):
+        # Säteen sisällä olevat rivit ja etäisyydet lähimmästä alkaen
+        positions = self._candidates(lat, lon, radius_km)
+        distance = haversine_km(lat, lon, self.lat[positions], self.lon[positions])
+        inside = distance <= radius_km
+        positions, distance = positions[inside], distance[inside]
+        order = np.argsort(distance, kind='stable')
+        return self.rows[positions[order]], distance[order]
+
+    def nearest_airfields(self, lat, lon, k=1):
+        # k lähintä lentopaikkaa annetulle pisteelle: [(nimi, km)]
+        distance = haversine_km(lat, lon, self.airfield_lat, self.airfield_lon)
+        order = np.argsort(distance, kind='stable')[:k]
+        return [(self.airfield_names[i], float(distance[i])) for i in order]
+
+    def _mask(self, rows):
+        if rows is None:
+            return slice(None)
+        return np.isin(self.rows, np.asarray(rows))
+
+    def airfield_counts(self, rows=None, max_km=20.0):
+        # Tapausten määrä lähimmän lentopaikan mukaan (enintään max_km päässä), suurin ensin
+        mask = self._mask(rows)
+        nearest = self.nearest[mask]
+        close = self.nearest_km[mask] <= max_km
+        counts = np.bincount(nearest[close], minlength=len(self.airfield_names))
+        order = np.argsort(-counts, kind='stable')
+        return [(self.airfield_names[i], int(counts[i])) for i in order if counts[i]]
+
+    def density(self, rows=None, cell_deg=None):
+        # Tapausten määrä ruutua kohden: (solun keskipisteen lat, lon, määrä) -taulukot
+        cell_deg = cell_deg or self.cell_deg
+        mask = self._mask(rows)
+        cy, cx = cell_coords(self.lat[mask], self.lon[mask], cell_deg)
+        if not len(cy):
+            return np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64)
+        cells, counts = np.unique(cy * CELL_STRIDE + cx, return_counts=True)
+        center_lat = (cells // CELL_STRIDE + 0.5) * cell_deg - 90.0
+        center_lon = (cells % CELL_STRIDE + 0.5) * cell_deg - 180.0
+        return center_lat, center_lon, counts
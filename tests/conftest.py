@@ -0,0 +1,15 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Projektin secrets.py (API-avain) peittää stdlibin secrets-moduulin, jota numpy.random
+# tarvitsee: stdlibin moduuli ladataan ennen projektin moduuleja, jotka lisätään polun loppuun.
+_saved_path = sys.path[:]
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != REPO_DIR]
+try:
+    import secrets  # noqa: F401
+finally:
+    sys.path[:] = _saved_path
+if REPO_DIR not in sys.path:
+    sys.path.append(REPO_DIR)
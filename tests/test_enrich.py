@@ -0,0 +1,74 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+pytest.importorskip("google.api_core")
+pytest.importorskip("pyarrow")
+
+import dashboard_data
+import data_enricher as de
+from ai_client import FakeModel
+
+REPORTS = [
+    {"id": "B11996L Laskuvarjohyppyonnettomuus Jyväskylän lentoasemalla 12.8.1991",
+     "text": "Laskuvarjohyppyonnettomuus Jyväskylän lentoasemalla, hyppy tehtiin Cessna-koneesta."},
+    {"id": "L2012-10 Yleisilmailukoneen vaurioituminen Malmilla",
+     "text": "Cessna 172 vaurioitui laskeutumisessa Malmin lentoasemalla."},
+]
+# Regex ei tunnista konetyyppiä: luokitus kysytään mallilta
+AI_REPORT = {"id": "L2013-01 Vaaratilanne lähestymisessä", "text": "Liikennekone menetti korkeutta lähestymisessä."}
+
+def write_input(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(de.INPUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(REPORTS, f, ensure_ascii=False)
+
+def offline_argv(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["data_enricher.py", "--offline", "--cache", "json", "--no-local-model", *args])
+
+def run_enrich(monkeypatch, *args):
+    offline_argv(monkeypatch, *args)
+    de.STATS.reset()
+    return de.enrich(de.parse_args())
+
+def test_enrich_writes_current_columnar_file(tmp_path, monkeypatch):
+    write_input(tmp_path, monkeypatch)
+
+    assert run_enrich(monkeypatch) == 2
+    assert dashboard_data.source_file() == dashboard_data.COLUMNAR_FILE
+    # Toinen ajo kirjoittaa molemmat tiedostot uudelleen; sarakemuotoinen pysyy valittuna
+    assert run_enrich(monkeypatch) == 2
+    assert dashboard_data.source_file() == dashboard_data.COLUMNAR_FILE
+    assert list(dashboard_data.load_frame(["id"])["id"]) == [r["id"] for r in REPORTS]
+
+def test_enrichers_keep_separate_stats():
+    de.STATS.reset()
+    first, second = de.Enricher(offline=True), de.Enricher(offline=True)
+    assert len(first.enrich_batch(REPORTS)) == 2
+    assert first.stats.counters
+    assert not second.stats.counters
+    assert not de.STATS.counters
+
+def test_enricher_inside_running_event_loop():
+    async def scenario():
+        # Synkroninen rajapinta toimii myös käynnissä olevan silmukan sisältä
+        sync_records = de.Enricher(model=FakeModel(responses=["Airbus"]), offline=True).enrich_batch([AI_REPORT])
+        enricher = de.Enricher(model=FakeModel(responses=["Boeing"]), offline=True)
+        async_records = await enricher.enrich_batch_async([AI_REPORT])
+        return sync_records, async_records
+
+    sync_records, async_records = asyncio.run(scenario())
+    assert [r["aircraft_type"] for r in sync_records] == ["Airbus"]
+    assert [r["aircraft_type"] for r in async_records] == ["Boeing"]
+
+def test_offline_run_does_not_create_geocoder(tmp_path, monkeypatch):
+    write_input(tmp_path, monkeypatch)
+    offline_argv(monkeypatch)
+    monkeypatch.setattr(de, "model", None)
+    monkeypatch.setattr(de, "geolocator", None)
+    monkeypatch.setattr(de, "create_model", lambda: None)
+    monkeypatch.setattr(de, "create_geolocator", lambda: pytest.fail("offline-ajo loi geokoodaajan"))
+    de.main()
+    assert de.geolocator is None
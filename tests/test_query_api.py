@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_in_repo(*args):
+    # Ajetaan erillisessä prosessissa projektin juuresta, jolloin secrets.py on polussa
+    return subprocess.run([sys.executable, *args], cwd=REPO_DIR, capture_output=True, text=True, timeout=120)
+
+def test_import_from_repo_root():
+    result = run_in_repo("-c", "import query_api")
+    assert result.returncode == 0, result.stderr
+
+def test_script_starts_from_repo_root():
+    result = run_in_repo("query_api.py", "--help")
+    assert result.returncode == 0, result.stderr
+    assert "--port" in result.stdout
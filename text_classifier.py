@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import os
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+MODEL_FILE = "aircraft_text_model.npz"
+EVAL_FILE = "aircraft_text_model_eval.json"
+MODEL_VERSION = 1
+
+# Sanojen merkki-n-grammit (3-5) tiivistetään 2^16 piirteeseen
+HASH_BITS = 16
+NGRAM_MIN = 3
+NGRAM_MAX = 5
+# Sama tekstin alku, jonka rikastin antaa AI:lle (prepare_entry: ai_text)
+MAX_CHARS = 800
+WORD_RE = re.compile(r"\w[\w-]*")
+
+# Tätä varmemmat ennusteet hyväksytään ilman AI-kyselyä
+DEFAULT_THRESHOLD = 0.8
+EVAL_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
+# --- PIIRTEET ---
+@lru_cache(maxsize=200000)
+def word_features(word):
+    # Sanat toistuvat raportista toiseen, joten n-grammien tiivisteet muistetaan sanoittain
+    padded = f" {word} "
+    grams = {padded[i:i + n] for n in range(NGRAM_MIN, NGRAM_MAX + 1) for i in range(len(padded) - n + 1)}
+    mask = (1 << HASH_BITS) - 1
+    return np.array([zlib.crc32(g.encode('utf-8')) & mask for g in grams], dtype=np.int64)
+
+def features(text):
+    # Harva vektori (piirreindeksit, painot): log(1 + tf), L2-normitettu
+    words = Counter(WORD_RE.findall((text or "")[:MAX_CHARS].lower().replace('\xad', '')))
+    if not words:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    grams = [word_features(word) for word in words]
+    idx, inverse = np.unique(np.concatenate(grams), return_inverse=True)
+    counts = np.repeat(np.fromiter(words.values(), dtype=np.float32, count=len(words)), [len(g) for g in grams])
+    values = np.log1p(np.bincount(inverse, weights=counts)).astype(np.float32)
+    return idx, values / np.linalg.norm(values)
+
+def softmax(z):
+    z = np.exp(z - z.max())
+    return z / z.sum()
+
+# --- LINEAARINEN LUOKITTELIJA ---
+class HashedTextClassifier:
+    # Monen luokan logistinen regressio tiivistetyillä merkki-n-grammeilla (vain numpy)
+    def __init__(self, labels, weights, bias):
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = bias
+        self.fingerprint = hashlib.sha256(weights.tobytes() + bias.tobytes()).hexdigest()[:16]
+
+    @classmethod
+    def train(cls, texts, labels, sample_weights=None, epochs=30, learning_rate=2.0, l2=1e-4, seed=1):
+        classes = sorted(set(labels))
+        targets = np.array([classes.index(label) for label in labels])
+        docs = [features(text) for text in texts]
+        sample_weights = np.ones(len(docs)) if sample_weights is None else np.asarray(sample_weights, dtype=float)
+        weights = np.zeros((1 << HASH_BITS, len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        # random eikä np.random: numpy.random tuo stdlibin secrets-moduulin, jonka
+        # projektin juuren secrets.py (API-avain) peittää
+        rng = random.Random(seed)
+        order = list(range(len(docs)))
+        for epoch in range(epochs):
+            rate = learning_rate / (1 + epoch * 0.2)
+            rng.shuffle(order)
+            for i in order:
+                idx, values = docs[i]
+                p = softmax(values @ weights[idx] + bias)
+                p[targets[i]] -= 1.0
+                p *= sample_weights[i]
+                # Painojen vaimennus vain tämän dokumentin riveille (laiska L2)
+                weights[idx] *= (1 - rate * l2)
+                weights[idx] -= rate * np.outer(values, p)
+                bias -= rate * p
+        return cls(classes, weights, bias)
+
+    def predict_proba(self, text):
+        idx, values = features(text)
+        return softmax(values @ self.weights[idx] + self.bias)
+
+    def predict(self, text):
+        # (luokka, varmuus 0..1)
+        p = self.predict_proba(text)
+        best = int(p.argmax())
+        return self.labels[best], float(p[best])
+
+    def save(self, filename=MODEL_FILE):
+        tmp_file = filename + ".tmp.npz"
+        np.savez_compressed(tmp_file, version=np.array(MODEL_VERSION), hash_bits=np.array(HASH_BITS),
+                            labels=np.array(self.labels, dtype=str), weights=self.weights, bias=self.bias)
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename=MODEL_FILE):
+        with np.load(filename, allow_pickle=False) as data:
+            if int(data["version"]) != MODEL_VERSION or int(data["hash_bits"]) != HASH_BITS:
+                raise ValueError(f"Mallitiedosto {filename} ei ole yhteensopiva (versio {int(data['version'])})")
+            return cls([str(label) for label in data["labels"]], data["weights"], data["bias"])
+
+def load_text_classifier(filename=MODEL_FILE):
+    if not filename or not os.path.exists(filename):
+        return None
+    return HashedTextClassifier.load(filename)
+
+# --- OPETUSDATA ---
+def build_dataset(input_file, data_file, cache_file):
+    # Raporttien tekstit syötteestä, luokat rikastetusta datasta. AI:n luokittelemat
+    # (regex ei osunut) erotellaan: niillä mitataan, kuinka hyvin malli korvaa AI-kyselyn.
+    import data_enricher as de
+
+    labels = {record["id"]: record["aircraft_type"] for record in de.iter_json_records(data_file)}
+    ai_labels = de.load_json(cache_file)
+    examples = []
+    for _, entry in de.iter_report_entries(de.iter_json_records(input_file)):
+        report_id = de.clean_soft_hyphens(entry['id'])
+        label = ai_labels.get(report_id) or labels.get(report_id)
+        if not label:
+            continue
+        text = report_id + " " + de.clean_soft_hyphens(entry['text'])
+        examples.append({"id": report_id, "text": text, "label": label, "ai": report_id in ai_labels})
+    return examples
+
+def balanced_weights(examples):
+    # Regex-osumia on moninkertaisesti AI-luokiteltuihin nähden, mutta mallia käytetään
+    # juuri regexin ohittamiin raportteihin: molemmat ryhmät painotetaan yhtä suuriksi.
+    ai_count = sum(1 for e in examples if e["ai"])
+    ai_weight = (len(examples) - ai_count) / ai_count if ai_count else 1.0
+    return [max(1.0, ai_weight) if e["ai"] else 1.0 for e in examples]
+
+def train_model(examples, **train_args):
+    return HashedTextClassifier.train([e["text"] for e in examples], [e["label"] for e in examples],
+                                      balanced_weights(examples), **train_args)
+
+# --- ARVIOINTI ---
+def cross_validate(examples, folds=5, seed=1, **train_args):
+    # AI-luokitellut jaetaan osiin; kukin osa ennustetaan mallilla, joka on opetettu
+    # kaikella muulla (regex-luokitellut + muut osat). Palauttaa [(oikea, ennuste, varmuus)].
+    ai_examples = [e for e in examples if e["ai"]]
+    rest = [e for e in examples if not e["ai"]]
+    order = list(range(len(ai_examples)))
+    random.Random(seed).shuffle(order)
+    predictions = []
+    for fold in range(folds):
+        held = [ai_examples[i] for i in order[fold::folds]]
+        if not held:
+            continue
+        held_ids = {e["id"] for e in held}
+        train = rest + [e for e in ai_examples if e["id"] not in held_ids]
+        model = train_model(train, seed=seed, **train_args)
+        for e in held:
+            label, confidence = model.predict(e["text"])
+            predictions.append((e["label"], label, confidence))
+    return predictions
+
+def evaluation_report(predictions, thresholds=EVAL_THRESHOLDS):
+    # Tarkkuus vs. AI-kutsut: kynnyksen ylittävät ratkaistaan paikallisesti, loput AI:lle.
+    # AI:n vastaus on tässä "oikea" luokka, joten kokonaistarkkuus = paikalliset osumat + AI:lle menevät.
+    n = len(predictions)
+    majority = Counter(truth for truth, _, _ in predictions).most_common(1)
+    rows = []
+    for threshold in thresholds:
+        local = [(truth, label) for truth, label, confidence in predictions if confidence >= threshold]
+        correct = sum(1 for truth, label in local if truth == label)
+        rows.append({
+            "threshold": threshold,
+            "local": len(local),
+            "local_accuracy": round(correct / len(local), 3) if local else None,
+            "ai_calls": n - len(local),
+            "ai_calls_saved": round(len(local) / n, 3) if n else None,
+            "overall_accuracy": round((correct + n - len(local)) / n, 3) if n else None,
+        })
+    return {
+        "examples": n,
+        "always_local_accuracy": round(sum(1 for t, l, _ in predictions if t == l) / n, 3) if n else None,
+        "majority_baseline": {"label": majority[0][0], "accuracy": round(majority[0][1] / n, 3)} if majority else None,
+        "thresholds": rows,
+    }
+
+def print_report(report):
+    print(f"Arvioitu {report['examples']} AI-luokitellulla raportilla (ristiinvalidointi).")
+    if report["majority_baseline"]:
+        print(f"Aina paikallinen malli: {report['always_local_accuracy']:.1%}, "
+              f"aina '{report['majority_baseline']['label']}': {report['majority_baseline']['accuracy']:.1%}")
+    print(f"  {'kynnys':>6}  {'paikall.':>8}  {'tarkkuus':>8}  {'AI-kutsut':>9}  {'säästö':>6}  {'kokonais':>8}")
+    for row in report["thresholds"]:
+        accuracy = f"{row['local_accuracy']:.1%}" if row["local_accuracy"] is not None else "-"
+        print(f"  {row['threshold']:>6.2f}  {row['local']:>8}  {accuracy:>8}  {row['ai_calls']:>9}  "
+              f"{row['ai_calls_saved']:>6.1%}  {row['overall_accuracy']:>8.1%}")
+
+def main():
+    import data_enricher as de
+
+    parser = argparse.ArgumentParser(description="Paikallinen konetyyppiluokittelija (regexin ja AI:n välissä)")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--input", default=de.INPUT_FILE, help="Raporttien tekstit")
+    parser.add_argument("--data", default=de.OUTPUT_FILE, help="Rikastettu data (luokat)")
+    parser.add_argument("--cache", default=de.AIRCRAFT_CACHE_FILE, help="AI:n luokitukset")
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--report", default=EVAL_FILE, help="Arviointiraportti JSON-muodossa")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=30)
+    args = parser.parse_args()
+
+    examples = build_dataset(args.input, args.data, args.cache)
+    if not examples:
+        print("Opetusdataa ei löydy (tarvitaan syöte, rikastettu data ja AI-välimuisti).")
+        return
+    print(f"Opetusdata: {len(examples)} raporttia, joista {sum(e['ai'] for e in examples)} AI:n luokittelemia.")
+
+    if args.command == "evaluate":
+        report = evaluation_report(cross_validate(examples, args.folds, epochs=args.epochs))
+        print_report(report)
+        de.save_json(report, args.report)
+        print(f"Raportti: {args.report}")
+        return
+
+    start = time.perf_counter()
+    model = train_model(examples, epochs=args.epochs)
+    print(f"Opetettu {time.perf_counter() - start:.1f} s:ssa, {len(model.labels)} luokkaa.")
+    word_features.cache_clear()
+    start = time.perf_counter()
+    for e in examples:
+        model.predict(e["text"])
+    print(f"Ennuste keskimäärin {(time.perf_counter() - start) / len(examples) * 1e6:.0f} µs/raportti (kylmä sanamuisti).")
+    model.save(args.model)
+    print(f"Malli tallennettu: {args.model} ({model.fingerprint})")
+
+if __name__ == "__main__":
+    main()